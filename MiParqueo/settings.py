@@ -41,11 +41,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.metricas.MetricasMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.servicios.CambioDeDiaMiddleware',
+    'core.parqueaderos.ParqueaderoMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -54,7 +57,7 @@ ROOT_URLCONF = 'MiParqueo.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.metricas.PlantillasInstrumentadas',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -62,6 +65,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'core.parqueaderos.contexto',
             ],
         },
     },
@@ -80,6 +84,10 @@ DATABASES = {
     }
 }
 
+# Espacios, reservas e incidencias van a la base de su sede
+# (Parqueadero.base_datos); una sede puede tener su propio alias aquí.
+DATABASE_ROUTERS = ['core.parqueaderos.EnrutadorParqueaderos']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -122,8 +130,75 @@ LOGIN_URL = 'core:login'
 LOGIN_REDIRECT_URL = 'core:home'
 LOGOUT_REDIRECT_URL = 'core:login'
 
+# Todo correo se guarda en la bandeja de salida (core.correo.CorreoSaliente)
+# y lo envía un trabajador en segundo plano con CORREO_BACKEND_ENVIO.
+EMAIL_BACKEND = 'core.correo.BackendCola'
 # Email backend for development (prints to console)
-EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+CORREO_BACKEND_ENVIO = 'django.core.mail.backends.console.EmailBackend'
+CORREO_MAX_INTENTOS = 5
+CORREO_RETRASO_BASE = 60  # segundos; se duplica en cada reintento
+CORREO_INTERVALO_BARRIDO = 30  # segundos entre barridos de reintentos vencidos
+
+# Instrumentación de rendimiento (ver core/metricas.py)
+# Con METRICAS_ACTIVAS = False el middleware se descarta al arrancar.
+METRICAS_ACTIVAS = True
+METRICAS_CONSULTA_LENTA_MS = 100
+METRICAS_MUESTRAS_LENTAS = 50
+
+# Caché en memoria placa -> vehículo (ver core/placas.py)
+CACHE_PLACAS_MAXIMO = 1024
+CACHE_PLACAS_TTL = 300  # segundos
+
+# Segundos que cada proceso conserva la lista de sedes (core/parqueaderos.py)
+SEDES_CACHE_TTL = 30
+
+# Cola de trabajos en segundo plano (ver core/tareas.py).
+# En False los trabajos se ejecutan en el mismo hilo de la petición.
+TAREAS_EN_SEGUNDO_PLANO = True
+
+# Segundos entre repasos de espacios RESERVADO cuyas reservas ya pasaron
+# (ver core/servicios.py: el estado depende de la fecha de hoy)
+ESTADOS_INTERVALO_RECALCULO = 600
+
+# Modo de portería con diario local (ver core/porteria.py): entradas y salidas
+# se anotan en un archivo con fsync y se aplican a la base en segundo plano.
+PORTERIA_MODO_DIARIO = False
+PORTERIA_DIARIO_DIR = BASE_DIR / 'diario_porteria'
+PORTERIA_TAMANO_LOTE = 200
+# Segundos entre sincronizaciones periódicas del diario (además de la que
+# sigue a cada evento). Trabajador aparte: manage.py reproducir_porteria --continuo
+PORTERIA_INTERVALO_SINCRONIZACION = 10
+
+# Destinatarios de los avisos de incidencias (mail_admins)
+ADMINS = []
+
+# Token para que Prometheus lea /metricas/ sin sesión de superusuario
+# (cabecera "Authorization: Bearer <token>"). Vacío: solo superusuarios.
+# No se confía en la IP de origen: detrás de un proxy todo llega de 127.0.0.1.
+METRICAS_TOKEN = ''
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'simple': {
+            'format': '{asctime} {levelname} {name}: {message}',
+            'style': '{',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'simple',
+        },
+    },
+    'loggers': {
+        'core': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+}
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
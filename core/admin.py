@@ -1,20 +1,204 @@
+import time
+
 from django.contrib import admin
-from .models import EspacioParqueadero, Reserva, Incidencia
+from django.contrib.auth import get_user_model
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils.functional import cached_property
+from .models import EspacioParqueadero, Reserva, Incidencia, CorreoSaliente, Vehiculo, Parqueadero, EventoPorteria
+from .placas import normalizar_placa
+
+# --- Utilidades para tablas grandes ---
+
+def conteo_estimado(queryset):
+    """
+    Número aproximado de filas de la tabla del queryset, leído de las
+    estadísticas del motor (sin recorrer la tabla). None si no se puede.
+    """
+    conexion = connections[queryset.db]
+    tabla = queryset.model._meta.db_table
+    with conexion.cursor() as cursor:
+        if conexion.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [tabla])
+        elif conexion.vendor == 'mysql':
+            cursor.execute(
+                'SELECT table_rows FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s',
+                [tabla],
+            )
+        elif conexion.vendor == 'sqlite':
+            # MAX(rowid) se resuelve con el índice de la clave primaria
+            cursor.execute(f'SELECT MAX(rowid) FROM {conexion.ops.quote_name(tabla)}')
+        else:
+            return None
+        fila = cursor.fetchone()
+    if not fila or fila[0] is None or fila[0] < 0:
+        return None
+    return int(fila[0])
+
+
+class PaginadorConteoEstimado(Paginator):
+    """
+    Evita el ``COUNT(*)`` completo de la tabla en cada página del admin: sin
+    filtros y con más de ``UMBRAL_ESTIMADO`` filas usa ``conteo_estimado``.
+    Con filtros el conteo es exacto (sin tope, para que el total y la
+    paginación lleguen a todas las filas); los filtros usan los índices.
+    """
+    UMBRAL_ESTIMADO = 10000
+
+    @cached_property
+    def count(self):
+        consulta = getattr(self.object_list, 'query', None)
+        if consulta is None or consulta.where:
+            return super().count
+        estimado = conteo_estimado(self.object_list)
+        if estimado is not None and estimado > self.UMBRAL_ESTIMADO:
+            return estimado
+        return super().count
+
+
+def filtro_por_placa(termino, campo='placa'):
+    """
+    Búsqueda por prefijo de placa normalizada. Se expresa como rango
+    (``>= 'ABC'`` y ``< 'ABC' + U+FFFF``) para que use el índice B-tree del
+    campo en cualquier motor, a diferencia de ``LIKE '%...%'``.
+    """
+    placa = normalizar_placa(termino)
+    if not placa:
+        return Q(pk__in=[])
+    return Q(**{f'{campo}__gte': placa, f'{campo}__lt': placa + '\uffff'})
+
+
+class AdminTablaGrande(admin.ModelAdmin):
+    paginator = PaginadorConteoEstimado
+    # No ejecutar un segundo COUNT(*) sin filtros para el "N en total"
+    show_full_result_count = False
+
+
+@admin.register(Parqueadero)
+class ParqueaderoAdmin(admin.ModelAdmin):
+    list_display = ('nombre', 'codigo', 'base_datos')
+    search_fields = ('nombre', 'codigo')
+    filter_horizontal = ('vigilantes',)
 
 @admin.register(EspacioParqueadero)
-class EspacioParqueaderoAdmin(admin.ModelAdmin):
-    list_display = ('numero', 'tipo', 'estado')
-    list_filter = ('estado', 'tipo')
+class EspacioParqueaderoAdmin(AdminTablaGrande):
+    list_display = ('numero', 'parqueadero', 'tipo', 'estado')
+    list_filter = ('parqueadero', 'estado', 'tipo')
+    list_select_related = ('parqueadero',)
     search_fields = ('numero',)
+    ordering = ('parqueadero', 'numero')
+
+    def get_search_results(self, request, queryset, search_term):
+        # Búsqueda exacta por número (índice único) en lugar de CAST + LIKE
+        termino = search_term.strip()
+        if not termino:
+            return queryset, False
+        if not termino.isdigit():
+            return queryset.none(), False
+        return queryset.filter(numero=int(termino)), False
+
+@admin.register(Vehiculo)
+class VehiculoAdmin(AdminTablaGrande):
+    list_display = ('placa', 'tipo', 'usuario', 'descripcion')
+    list_filter = ('tipo',)
+    list_select_related = ('usuario',)
+    search_fields = ('placa',)
+    autocomplete_fields = ('usuario',)
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        return queryset.filter(filtro_por_placa(search_term)), False
 
 @admin.register(Reserva)
-class ReservaAdmin(admin.ModelAdmin):
-    list_display = ('id', 'usuario', 'espacio', 'fecha', 'hora_inicio', 'hora_fin', 'placa', 'estado')
-    list_filter = ('estado', 'fecha', 'tipo_vehiculo')
+class ReservaAdmin(AdminTablaGrande):
+    list_display = ('id', 'parqueadero', 'usuario', 'espacio', 'fecha', 'hora_inicio', 'hora_fin', 'placa', 'estado')
+    list_filter = ('parqueadero', 'estado', 'fecha', 'tipo_vehiculo')
+    list_select_related = ('parqueadero', 'usuario', 'espacio')
     search_fields = ('placa', 'usuario__username')
+    search_help_text = 'Prefijo de placa (ej. ABC1) o nombre de usuario exacto.'
+    autocomplete_fields = ('usuario', 'espacio', 'vehiculo')
+    # Sin date_hierarchy: arma los enlaces con SELECT DISTINCT sobre una
+    # función de fecha (no usa índice). El filtro 'fecha' usa rangos indexados.
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Placa por prefijo normalizado o usuario exacto; ambas condiciones usan
+        índice (Reserva.placa y auth_user.username) y no hacen JOIN.
+        """
+        termino = search_term.strip()
+        if not termino:
+            return queryset, False
+        usuarios = get_user_model().objects.filter(username=termino).values('pk')
+        return queryset.filter(filtro_por_placa(termino) | Q(usuario__in=usuarios)), False
+
+    def get_urls(self):
+        urls = [
+            path('pronostico/', self.admin_site.admin_view(self.pronostico_view), name='core_reserva_pronostico'),
+        ]
+        return urls + super().get_urls()
+
+    def pronostico_view(self, request):
+        from .pronostico import (NumpyNoDisponible, SEMANAS_MAXIMAS, TIPOS, calcular_pronostico,
+                                 capacidad_actual, maximo_por_tipo, proxima_semana)
+
+        context = dict(self.admin_site.each_context(request), title='Pronóstico de capacidad', tipos=TIPOS)
+        inicio = time.perf_counter()
+        try:
+            semanas = request.GET.get('semanas', '')
+            semanas = int(semanas) if semanas.isdigit() else 52
+            pronostico = calcular_pronostico(semanas=semanas if 1 <= semanas <= SEMANAS_MAXIMAS else 52)
+        except NumpyNoDisponible as error:
+            context['error'] = str(error)
+        else:
+            semana = proxima_semana(pronostico)
+            capacidad = capacidad_actual()
+            context.update(
+                pronostico=pronostico,
+                semana=semana,
+                resumen=[(tipo, maximo, capacidad[tipo]) for tipo, maximo in maximo_por_tipo(semana).items()],
+                duracion=time.perf_counter() - inicio,
+            )
+        return TemplateResponse(request, 'admin/core/reserva/pronostico.html', context)
 
 @admin.register(Incidencia)
-class IncidenciaAdmin(admin.ModelAdmin):
-    list_display = ('tipo', 'espacio', 'reportado_por', 'fecha_hora')
-    list_filter = ('tipo', 'fecha_hora')
-    search_fields = ('descripcion',)
+class IncidenciaAdmin(AdminTablaGrande):
+    list_display = ('tipo', 'parqueadero', 'espacio', 'placa', 'reportado_por', 'fecha_hora', 'procesada_en')
+    list_filter = ('parqueadero', 'tipo', 'fecha_hora')
+    list_select_related = ('parqueadero', 'espacio', 'reportado_por')
+    search_fields = ('placa', 'descripcion')
+    search_help_text = 'Prefijo de placa (ej. ABC1). Para buscar en la descripción: texto:<palabras> (recorre la tabla).'
+    autocomplete_fields = ('espacio', 'reportado_por', 'reserva')
+    PREFIJO_TEXTO = 'texto:'
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Por defecto solo prefijo de placa (índice). La búsqueda en la
+        descripción es ``LIKE '%...%'`` y recorre toda la tabla, así que
+        hay que pedirla explícitamente con ``texto:``.
+        """
+        termino = search_term.strip()
+        if not termino:
+            return queryset, False
+        if termino.lower().startswith(self.PREFIJO_TEXTO):
+            texto = termino[len(self.PREFIJO_TEXTO):].strip()
+            return (queryset.filter(descripcion__icontains=texto) if texto else queryset), False
+        return queryset.filter(filtro_por_placa(termino)), False
+
+@admin.register(CorreoSaliente)
+class CorreoSalienteAdmin(admin.ModelAdmin):
+    list_display = ('id', 'asunto', 'estado', 'intentos', 'proximo_intento', 'enviado_en')
+    list_filter = ('estado',)
+    search_fields = ('asunto',)
+    readonly_fields = ('creado_en', 'enviado_en', 'lote')
+
+@admin.register(EventoPorteria)
+class EventoPorteriaAdmin(admin.ModelAdmin):
+    list_display = ('tipo', 'parqueadero', 'reserva', 'vigilante', 'ocurrido_en', 'aplicado_en', 'resultado', 'detalle')
+    list_filter = ('resultado', 'tipo', 'parqueadero')
+    list_select_related = ('parqueadero', 'reserva', 'vigilante')
+    search_fields = ('uuid',)
+    readonly_fields = ('uuid', 'tipo', 'parqueadero', 'reserva', 'vigilante', 'ocurrido_en', 'aplicado_en')
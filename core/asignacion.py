@@ -0,0 +1,154 @@
+"""
+Motor de asignación de espacios.
+
+Dada una solicitud (tipo de vehículo, fecha y horario) elige el espacio
+compatible cuyo hueco libre se ajusta mejor a la reserva ("best-fit"): el
+que deja menos minutos libres sin usar alrededor de ella. Así los huecos
+cortos se llenan y quedan libres los espacios con huecos largos, en vez de
+fragmentar todo el parqueadero como ocurre con "first-fit".
+
+Reglas de compatibilidad (``COMPATIBLES``), en orden de preferencia:
+- CARRO: solo espacios CARRO (los DISCAPACIDAD quedan reservados).
+- MOTO: solo espacios MOTO.
+- DISCAPACIDAD: primero espacios DISCAPACIDAD y, si no hay, CARRO.
+
+El índice de intervalos de un día vive en memoria; ``IndiceIntervalos.del_dia``
+lo carga con dos consultas. ``espacios_libres`` resuelve en la base de datos
+qué espacios puede elegir el cliente en el formulario de reserva.
+
+Todo se limita a una sede: la indicada o, si no, la sede actual
+(``core.parqueaderos``).
+"""
+from bisect import bisect_left, insort
+
+from django.db.models import Exists, OuterRef
+
+from .models import EspacioParqueadero, Reserva
+from .parqueaderos import parqueadero_actual
+
+MINUTOS_DIA = 24 * 60
+
+COMPATIBLES = {
+    'CARRO': [['CARRO']],
+    'MOTO': [['MOTO']],
+    'DISCAPACIDAD': [['DISCAPACIDAD'], ['CARRO']],
+}
+
+
+def es_compatible(tipo_vehiculo, tipo_espacio):
+    return any(tipo_espacio in grupo for grupo in COMPATIBLES.get(tipo_vehiculo, []))
+
+
+def tipos_compatibles(tipo_vehiculo):
+    return [tipo for grupo in COMPATIBLES.get(tipo_vehiculo, []) for tipo in grupo]
+
+
+def _de_la_sede(queryset, parqueadero):
+    parqueadero = parqueadero or parqueadero_actual()
+    return queryset.filter(parqueadero=parqueadero) if parqueadero is not None else queryset
+
+
+def espacios_libres(fecha, tipo_vehiculo, hora_inicio, hora_fin, parqueadero=None):
+    """
+    Espacios compatibles con ``tipo_vehiculo``, no bloqueados y sin reservas
+    activas que se solapen con el horario. Una sola consulta (NOT EXISTS sobre
+    el índice (espacio, fecha)) que devuelve únicamente los espacios libres.
+    """
+    solapadas = Reserva.objects.filter(
+        espacio=OuterRef('pk'),
+        fecha=fecha,
+        estado='RESERVADA',
+        hora_inicio__lt=hora_fin,
+        hora_fin__gt=hora_inicio,
+    )
+    return (
+        _de_la_sede(EspacioParqueadero.objects, parqueadero)
+        .filter(tipo__in=tipos_compatibles(tipo_vehiculo))
+        .exclude(estado='BLOQUEADO')
+        .exclude(Exists(solapadas))
+        .order_by('numero')
+    )
+
+
+def minutos(hora):
+    return hora.hour * 60 + hora.minute
+
+
+class IndiceIntervalos:
+    """Intervalos ocupados (en minutos del día) de cada espacio para una fecha."""
+
+    def __init__(self, espacios):
+        # espacios: iterable de (id, numero, tipo)
+        self.espacios = {}
+        self.por_tipo = {}
+        self.ocupados = {}
+        for espacio_id, numero, tipo in sorted(espacios, key=lambda e: e[1]):
+            self.espacios[espacio_id] = (numero, tipo)
+            self.por_tipo.setdefault(tipo, []).append(espacio_id)
+            self.ocupados[espacio_id] = []
+
+    @classmethod
+    def del_dia(cls, fecha, tipos=None, parqueadero=None):
+        espacios = _de_la_sede(EspacioParqueadero.objects, parqueadero).exclude(estado='BLOQUEADO')
+        reservas = _de_la_sede(Reserva.objects, parqueadero).filter(fecha=fecha, estado='RESERVADA')
+        if tipos is not None:
+            espacios = espacios.filter(tipo__in=tipos)
+            reservas = reservas.filter(espacio__tipo__in=tipos)
+        indice = cls(espacios.values_list('id', 'numero', 'tipo'))
+        for espacio_id, inicio, fin in reservas.values_list('espacio_id', 'hora_inicio', 'hora_fin'):
+            if espacio_id in indice.ocupados:
+                indice.agregar(espacio_id, minutos(inicio), minutos(fin))
+        return indice
+
+    def agregar(self, espacio_id, inicio, fin):
+        insort(self.ocupados[espacio_id], (inicio, fin))
+
+    def hueco(self, espacio_id, inicio, fin):
+        """
+        Devuelve el hueco libre ``(desde, hasta)`` que contiene ``[inicio, fin)``
+        o None si el intervalo se solapa con una reserva.
+        """
+        ocupados = self.ocupados[espacio_id]
+        i = bisect_left(ocupados, (fin,))  # primera reserva que empieza en o después de ``fin``
+        desde = ocupados[i - 1][1] if i else 0
+        if desde > inicio:
+            return None
+        hasta = ocupados[i][0] if i < len(ocupados) else MINUTOS_DIA
+        return desde, hasta
+
+
+def _desperdicio(indice, espacio_id, inicio, fin):
+    hueco = indice.hueco(espacio_id, inicio, fin)
+    if hueco is None:
+        return None
+    return (hueco[1] - hueco[0]) - (fin - inicio)
+
+
+def elegir_espacio(indice, tipo_vehiculo, inicio, fin, estrategia='best_fit'):
+    """
+    Devuelve el id del espacio elegido (o None si no hay lugar).
+    ``inicio`` y ``fin`` en minutos del día. ``estrategia``: 'best_fit' o
+    'first_fit' (el primero que cabe, por número; se usa como referencia).
+    """
+    for grupo in COMPATIBLES.get(tipo_vehiculo, []):
+        mejor = None
+        for tipo in grupo:
+            for espacio_id in indice.por_tipo.get(tipo, []):
+                desperdicio = _desperdicio(indice, espacio_id, inicio, fin)
+                if desperdicio is None:
+                    continue
+                if estrategia == 'first_fit':
+                    return espacio_id
+                if mejor is None or desperdicio < mejor[0]:
+                    mejor = (desperdicio, espacio_id)
+                    if desperdicio == 0:
+                        break
+        if mejor is not None:
+            return mejor[1]
+    return None
+
+
+def asignar_espacio(fecha, tipo_vehiculo, hora_inicio, hora_fin, parqueadero=None):
+    """Elige un espacio para una reserva nueva. Devuelve el id o None."""
+    indice = IndiceIntervalos.del_dia(fecha, tipos=tipos_compatibles(tipo_vehiculo), parqueadero=parqueadero)
+    return elegir_espacio(indice, tipo_vehiculo, minutos(hora_inicio), minutos(hora_fin))
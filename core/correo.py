@@ -0,0 +1,209 @@
+"""
+Bandeja de salida de correo.
+
+``EMAIL_BACKEND = 'core.correo.BackendCola'`` hace que todo envío de Django
+(restablecer contraseña, ``mail_admins``, confirmaciones de reserva...)
+solo inserte filas en ``CorreoSaliente``; la petición no espera al servidor
+SMTP. El envío real lo hace ``enviar_pendientes`` con el backend de
+``CORREO_BACKEND_ENVIO``, en lotes y reutilizando una sola conexión:
+- En segundo plano, por la cola ``cola_correos`` al confirmar la transacción.
+- Con el barrido periódico de esa cola (cada ``CORREO_INTERVALO_BARRIDO``
+  segundos) y con ``manage.py enviar_correos --continuo``: reintentos
+  vencidos y correos que quedaron en la base tras reiniciar el proceso.
+
+Los fallos se reintentan con espera exponencial (``CORREO_RETRASO_BASE``)
+hasta ``CORREO_MAX_INTENTOS``; después el correo queda FALLIDO. La espera la
+marca solo ``proximo_intento``: la cola no reintenta en memoria.
+"""
+import datetime
+import logging
+import uuid
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection, send_mail
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db.models import Q
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import CorreoSaliente
+from .tareas import ColaTrabajos
+
+logger = logging.getLogger(__name__)
+
+# Tiempo que un lote reclamado queda reservado antes de poder reclamarse otra vez
+TIEMPO_RECLAMO = datetime.timedelta(minutes=5)
+
+
+class BackendCola(BaseEmailBackend):
+    """Backend de Django que encola los mensajes en lugar de enviarlos."""
+
+    def send_messages(self, email_messages):
+        filas = []
+        for mensaje in email_messages:
+            html = ''
+            for contenido, tipo in getattr(mensaje, 'alternatives', []):
+                if tipo == 'text/html':
+                    html = contenido
+            filas.append(CorreoSaliente(
+                asunto=mensaje.subject,
+                cuerpo=mensaje.body,
+                cuerpo_html=html,
+                remitente=mensaje.from_email,
+                destinatarios=list(mensaje.to),
+                extra={
+                    'cc': list(mensaje.cc),
+                    'bcc': list(mensaje.bcc),
+                    'reply_to': list(mensaje.reply_to),
+                    'headers': dict(mensaje.extra_headers),
+                },
+            ))
+        try:
+            creados = CorreoSaliente.objects.bulk_create(filas)
+        except Exception:
+            if not self.fail_silently:
+                raise
+            logger.exception('No se pudieron encolar %d correos', len(filas))
+            return 0
+        for correo in creados:
+            cola_correos.encolar_al_confirmar(correo.id)
+        return len(creados)
+
+
+def _construir_mensaje(correo, conexion):
+    mensaje = EmailMultiAlternatives(
+        subject=correo.asunto,
+        body=correo.cuerpo,
+        from_email=correo.remitente,
+        to=correo.destinatarios,
+        cc=correo.extra.get('cc'),
+        bcc=correo.extra.get('bcc'),
+        reply_to=correo.extra.get('reply_to'),
+        headers=correo.extra.get('headers'),
+        connection=conexion,
+    )
+    if correo.cuerpo_html:
+        mensaje.attach_alternative(correo.cuerpo_html, 'text/html')
+    return mensaje
+
+
+def _reclamar(ids, limite):
+    """
+    Marca un lote como ENVIANDO con un identificador propio para que dos
+    trabajadores no envíen el mismo correo. Los lotes abandonados (proceso
+    caído) vuelven a estar disponibles al vencer ``proximo_intento``.
+    """
+    ahora = timezone.now()
+    reclamables = Q(estado='PENDIENTE') | Q(estado='ENVIANDO', proximo_intento__lte=ahora)
+    # También con ids explícitos se respeta proximo_intento (un correo recién
+    # encolado ya lo tiene vencido): así ningún camino se salta la espera.
+    disponibles = CorreoSaliente.objects.filter(reclamables, proximo_intento__lte=ahora)
+    if ids is not None:
+        disponibles = disponibles.filter(id__in=ids)
+    candidatos = list(disponibles.order_by('proximo_intento').values_list('id', flat=True)[:limite])
+    if not candidatos:
+        return []
+    lote = uuid.uuid4().hex
+    CorreoSaliente.objects.filter(reclamables, id__in=candidatos).update(
+        estado='ENVIANDO', lote=lote, proximo_intento=ahora + TIEMPO_RECLAMO,
+    )
+    return list(CorreoSaliente.objects.filter(lote=lote, estado='ENVIANDO'))
+
+
+def _registrar_fallo(correo, error):
+    """
+    Anota un intento fallido: vuelve a PENDIENTE con espera exponencial o,
+    al llegar a ``CORREO_MAX_INTENTOS``, queda FALLIDO. True si se reintentará.
+    """
+    max_intentos = getattr(settings, 'CORREO_MAX_INTENTOS', 5)
+    retraso_base = getattr(settings, 'CORREO_RETRASO_BASE', 60)
+    correo.intentos += 1
+    correo.ultimo_error = str(error)[:1000]
+    if correo.intentos >= max_intentos:
+        correo.estado = 'FALLIDO'
+        logger.error('Correo %s descartado tras %d intentos: %s', correo.id, correo.intentos, error)
+        return False
+    correo.estado = 'PENDIENTE'
+    correo.proximo_intento = timezone.now() + datetime.timedelta(seconds=retraso_base * 2 ** (correo.intentos - 1))
+    return True
+
+
+def enviar_pendientes(ids=None, limite=50):
+    """
+    Envía un lote de correos por una sola conexión.
+    Devuelve ``(procesados, reintentar)``: cuántos correos se reclamaron y
+    los ids que fallaron y siguen pendientes de reintento.
+    """
+    correos = _reclamar(ids, limite)
+    if not correos:
+        return 0, []
+
+    reintentar = []
+    conexion = get_connection(getattr(settings, 'CORREO_BACKEND_ENVIO', None))
+    try:
+        conexion.open()
+        for correo in correos:
+            try:
+                conexion.send_messages([_construir_mensaje(correo, conexion)])
+            except Exception as error:
+                if _registrar_fallo(correo, error):
+                    reintentar.append(correo.id)
+            else:
+                correo.intentos += 1
+                correo.estado = 'ENVIADO'
+                correo.enviado_en = timezone.now()
+    except Exception as error:
+        # No se pudo abrir la conexión (servidor caído, credenciales...):
+        # cuenta como intento fallido para todo el lote
+        logger.exception('No se pudo abrir la conexión de correo')
+        for correo in correos:
+            if correo.estado == 'ENVIANDO' and _registrar_fallo(correo, error):
+                reintentar.append(correo.id)
+    finally:
+        conexion.close()
+        CorreoSaliente.objects.bulk_update(
+            correos, ['estado', 'intentos', 'ultimo_error', 'proximo_intento', 'enviado_en'],
+        )
+    return len(correos), reintentar
+
+
+# Elemento que encola el barrido periódico de cola_correos
+BARRIDO = 'barrido'
+
+
+def _enviar_encolados(elementos):
+    """
+    Lote de la cola: ids recién encolados y, si toca, el barrido de la
+    bandeja. Nunca devuelve fallidos para reintentar en memoria: el
+    reintento queda programado en ``proximo_intento`` y lo recoge el barrido.
+    """
+    ids = [elemento for elemento in elementos if elemento != BARRIDO]
+    if ids:
+        enviar_pendientes(ids, limite=len(ids))
+    if BARRIDO in elementos:
+        while enviar_pendientes()[0]:
+            pass
+    return []
+
+
+cola_correos = ColaTrabajos(
+    'correos',
+    _enviar_encolados,
+    tamano_lote=50,
+    espera_lote=1.0,
+    periodo=getattr(settings, 'CORREO_INTERVALO_BARRIDO', 30),
+    elemento_periodico=BARRIDO,
+)
+
+
+def enviar_confirmacion_reserva(reserva):
+    """Encola el correo de confirmación de una reserva (no bloquea la petición)."""
+    if not reserva.usuario.email:
+        return
+    cuerpo = render_to_string('correo/confirmacion_reserva.txt', {'reserva': reserva})
+    send_mail(
+        f'Reserva confirmada - Espacio {reserva.espacio.numero}',
+        cuerpo,
+        None,
+        [reserva.usuario.email],
+    )
@@ -3,32 +3,161 @@ from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.db.models import Q
-from .models import Reserva, EspacioParqueadero, Vehiculo
+from .models import Reserva, EspacioParqueadero, Vehiculo, Incidencia
+from .placas import buscar_vehiculo, normalizar_placa
+from .asignacion import asignar_espacio, es_compatible, espacios_libres
+
+
+def _espacios_de(parqueadero):
+    espacios = EspacioParqueadero.objects.all()
+    return espacios.filter(parqueadero=parqueadero) if parqueadero is not None else espacios
+
+
+def etiqueta_espacio(espacio):
+    # Sin el estado actual: lo que importa es si está libre en el horario pedido
+    return f"Espacio {espacio.numero} - {espacio.tipo}"
+
+
+def tipo_con_vehiculo(tipo_elegido, vehiculo):
+    """
+    Tipo de reserva para un vehículo registrado: el del vehículo o, solo
+    para un CARRO, DISCAPACIDAD elegido a mano (espacios preferenciales, que
+    recurren a CARRO). Cualquier otro tipo distinto no se acepta.
+    """
+    if not tipo_elegido or tipo_elegido == vehiculo.tipo:
+        return vehiculo.tipo
+    if tipo_elegido == 'DISCAPACIDAD' and vehiculo.tipo == 'CARRO':
+        return tipo_elegido
+    permitidos = 'CARRO o DISCAPACIDAD' if vehiculo.tipo == 'CARRO' else vehiculo.tipo
+    raise ValidationError(
+        f'El vehículo {vehiculo.placa} está registrado como {vehiculo.tipo}; '
+        f'solo puede reservarse como {permitidos}.',
+        code='tipo_vehiculo',
+    )
+
+
+class FiltroEspaciosForm(forms.Form):
+    """
+    Datos con los que se filtran los espacios ofrecidos al reservar.
+    Lo usan ``ReservaForm`` y la vista JSON ``core:espacios_libres``.
+    """
+    fecha = forms.DateField()
+    hora_inicio = forms.TimeField()
+    hora_fin = forms.TimeField()
+    tipo_vehiculo = forms.ChoiceField(choices=Reserva.TIPO_VEHICULO_CHOICES, required=False)
+    vehiculo = forms.ModelChoiceField(queryset=Vehiculo.objects.none(), required=False)
+
+    def __init__(self, *args, user=None, parqueadero=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.parqueadero = parqueadero
+        if user is not None:
+            self.fields['vehiculo'].queryset = user.vehiculos.all()
+
+    def clean(self):
+        cleaned_data = super().clean()
+        vehiculo = cleaned_data.get('vehiculo')
+        if vehiculo:
+            cleaned_data['tipo_vehiculo'] = tipo_con_vehiculo(cleaned_data.get('tipo_vehiculo'), vehiculo)
+        if not cleaned_data.get('tipo_vehiculo'):
+            raise ValidationError('Seleccione el tipo de vehículo o un vehículo registrado.')
+        hora_inicio = cleaned_data.get('hora_inicio')
+        hora_fin = cleaned_data.get('hora_fin')
+        if hora_inicio and hora_fin and hora_inicio >= hora_fin:
+            raise ValidationError('La hora de inicio debe ser anterior a la hora de fin.')
+        return cleaned_data
+
+    def espacios(self):
+        datos = self.cleaned_data
+        return espacios_libres(
+            datos['fecha'], datos['tipo_vehiculo'], datos['hora_inicio'], datos['hora_fin'], parqueadero=self.parqueadero,
+        )
+
 
 class ReservaForm(forms.ModelForm):
     class Meta:
         model = Reserva
-        fields = ['espacio', 'fecha', 'hora_inicio', 'hora_fin', 'tipo_vehiculo', 'placa']
+        fields = ['espacio', 'vehiculo', 'fecha', 'hora_inicio', 'hora_fin', 'tipo_vehiculo', 'placa']
+        labels = {
+            'vehiculo': 'Vehículo registrado',
+        }
+        help_texts = {
+            'placa': 'No es necesaria si selecciona un vehículo registrado.',
+            'tipo_vehiculo': 'DISCAPACIDAD usa los espacios preferenciales.',
+        }
         widgets = {
             'fecha': forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}),
             'hora_inicio': forms.TimeInput(attrs={'type': 'time', 'class': 'form-control'}),
             'hora_fin': forms.TimeInput(attrs={'type': 'time', 'class': 'form-control'}),
             'espacio': forms.Select(attrs={'class': 'form-select'}),
+            'vehiculo': forms.Select(attrs={'class': 'form-select'}),
             'tipo_vehiculo': forms.Select(attrs={'class': 'form-select'}),
             'placa': forms.TextInput(attrs={'class': 'form-control'}),
         }
 
+    def __init__(self, *args, user=None, parqueadero=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.user = user
+        self.parqueadero = parqueadero
+        # Solo se ofrecen los vehículos del usuario; placa y tipo se autocompletan
+        vehiculos = user.vehiculos.all() if user is not None else Vehiculo.objects.none()
+        self.fields['vehiculo'].queryset = vehiculos
+        self.fields['vehiculo'].empty_label = 'Ingresar placa manualmente'
+        self.fields['placa'].required = False
+        self.fields['tipo_vehiculo'].required = False
+        # Sin espacio elegido, el motor de asignación escoge el que mejor encaja
+        self.fields['espacio'].required = False
+        self.fields['espacio'].empty_label = 'Asignar automáticamente'
+        self.fields['espacio'].label_from_instance = etiqueta_espacio
+        self.fields['espacio'].error_messages['invalid_choice'] = (
+            'El espacio elegido no está libre en ese horario o no admite ese tipo de vehículo.'
+        )
+        self.fields['espacio'].queryset = self._espacios_ofrecidos(user)
+        self.vehiculo_registrado = None
+
+    def _espacios_ofrecidos(self, user):
+        """
+        No se listan todos los espacios del parqueadero: con fecha, horario y
+        tipo se ofrecen solo los compatibles y libres (el resto de opciones
+        las carga el navegador desde ``core:espacios_libres``). Sin esos datos
+        solo se incluye el espacio ya elegido, si lo hay.
+        """
+        if self.is_bound:
+            filtro = FiltroEspaciosForm(self.data, user=user, parqueadero=self.parqueadero, prefix=self.prefix)
+            if filtro.is_valid():
+                return filtro.espacios()
+            elegido = self.data.get(self.add_prefix('espacio'))
+        else:
+            elegido = self.initial.get('espacio')
+        if not str(elegido or '').isdigit():
+            return EspacioParqueadero.objects.none()
+        return _espacios_de(self.parqueadero).filter(pk=elegido)
+
+    def clean_placa(self):
+        return normalizar_placa(self.cleaned_data.get('placa'))
+
     def clean(self):
         cleaned_data = super().clean()
+        self._completar_vehiculo(cleaned_data)
         espacio = cleaned_data.get('espacio')
         fecha = cleaned_data.get('fecha')
         hora_inicio = cleaned_data.get('hora_inicio')
         hora_fin = cleaned_data.get('hora_fin')
 
+        tipo_vehiculo = cleaned_data.get('tipo_vehiculo')
+
         if hora_inicio and hora_fin:
             if hora_inicio >= hora_fin:
                 raise ValidationError("La hora de inicio debe ser anterior a la hora de fin.")
 
+            if espacio and tipo_vehiculo and not es_compatible(tipo_vehiculo, espacio.tipo):
+                raise ValidationError(f"El espacio {espacio.numero} ({espacio.tipo}) no admite vehículos {tipo_vehiculo}.")
+
+            if not espacio and fecha and tipo_vehiculo:
+                espacio_id = asignar_espacio(fecha, tipo_vehiculo, hora_inicio, hora_fin, parqueadero=self.parqueadero)
+                if espacio_id is None:
+                    raise ValidationError("No hay espacios disponibles para ese tipo de vehículo en ese horario.")
+                espacio = cleaned_data['espacio'] = EspacioParqueadero.objects.get(pk=espacio_id)
+
             # Validar solapamiento de reservas
             # Se busca si existe alguna reserva para el mismo espacio y fecha
             # que se solape en el rango de horas.
@@ -46,6 +175,42 @@ class ReservaForm(forms.ModelForm):
 
         return cleaned_data
 
+    def _completar_vehiculo(self, cleaned_data):
+        vehiculo = cleaned_data.get('vehiculo')
+        if vehiculo:
+            cleaned_data['placa'] = vehiculo.placa
+            self._fijar_tipo(cleaned_data, vehiculo)
+            return
+
+        placa = cleaned_data.get('placa')
+        if not placa:
+            self.add_error('placa', 'Ingrese la placa o seleccione un vehículo registrado.')
+            return
+        # Placa escrita a mano: si está registrada a nombre del usuario se
+        # enlaza (vía caché de placas). Una placa de otro usuario no se
+        # enlaza; la portería la encuentra igual por la placa.
+        registrado = buscar_vehiculo(placa)
+        if registrado and self.user is not None and registrado.usuario_id == self.user.id:
+            self.vehiculo_registrado = registrado
+        if self.vehiculo_registrado:
+            self._fijar_tipo(cleaned_data, self.vehiculo_registrado)
+        elif not cleaned_data.get('tipo_vehiculo'):
+            self.add_error('tipo_vehiculo', 'Seleccione el tipo de vehículo.')
+
+    def _fijar_tipo(self, cleaned_data, vehiculo):
+        try:
+            cleaned_data['tipo_vehiculo'] = tipo_con_vehiculo(cleaned_data.get('tipo_vehiculo'), vehiculo)
+        except ValidationError as error:
+            self.add_error('tipo_vehiculo', error)
+
+    def save(self, commit=True):
+        reserva = super().save(commit=False)
+        if reserva.vehiculo_id is None and self.vehiculo_registrado:
+            reserva.vehiculo_id = self.vehiculo_registrado.vehiculo_id
+        if commit:
+            reserva.save()
+        return reserva
+
 class RegistroForm(UserCreationForm):
     email = forms.EmailField(required=True, widget=forms.EmailInput(attrs={'class': 'form-control'}))
     first_name = forms.CharField(required=True, widget=forms.TextInput(attrs={'class': 'form-control'}))
@@ -67,4 +232,45 @@ class VehiculoForm(forms.ModelForm):
             'tipo': forms.Select(attrs={'class': 'form-select'}),
             'descripcion': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Ej: Toyota Corolla Rojo'}),
         }
+        error_messages = {
+            'placa': {'unique': 'Ya existe un vehículo registrado con esta placa.'},
+        }
+
+    def clean_placa(self):
+        # La unicidad la valida validate_unique() contra la base (la caché
+        # de placas puede estar desactualizada en otros procesos)
+        return normalizar_placa(self.cleaned_data.get('placa'))
+
 
+class IncidenciaForm(forms.ModelForm):
+    """Reporte rápido desde la portería: los datos llegan como campos ocultos."""
+    DESCRIPCION_POR_DEFECTO = {
+        'SIN_RESERVA': 'Vehículo sin reserva activa en portería.',
+        'DANIO_ESPACIO': 'Daño reportado en el espacio.',
+        'OCUPACION_INDEBIDA': 'Espacio ocupado sin reserva.',
+    }
+
+    class Meta:
+        model = Incidencia
+        fields = ['tipo', 'espacio', 'placa', 'descripcion']
+        widgets = {
+            'tipo': forms.HiddenInput(),
+            'espacio': forms.HiddenInput(),
+            'placa': forms.HiddenInput(),
+            'descripcion': forms.TextInput(attrs={'class': 'form-control form-control-sm', 'placeholder': 'Detalle (opcional)'}),
+        }
+
+    def __init__(self, *args, parqueadero=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['descripcion'].required = False
+        # Solo espacios de la sede del vigilante
+        self.fields['espacio'].queryset = _espacios_de(parqueadero)
+
+    def clean_placa(self):
+        return normalizar_placa(self.cleaned_data.get('placa'))
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if not cleaned_data.get('descripcion'):
+            cleaned_data['descripcion'] = self.DESCRIPCION_POR_DEFECTO.get(cleaned_data.get('tipo'), 'Sin detalle.')
+        return cleaned_data
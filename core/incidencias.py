@@ -0,0 +1,98 @@
+"""
+Procesamiento en segundo plano de incidencias reportadas desde la portería.
+
+La vista solo inserta la ``Incidencia`` y encola su id; aquí se hace lo lento:
+- Enlazar la ``Reserva`` relacionada (por placa o por el espacio ocupado).
+- Bloquear el espacio si el tipo es DANIO_ESPACIO.
+- Notificar a los administradores (un correo por lote).
+
+``procesada_en`` queda en NULL hasta que todo termina; ``manage.py
+procesar_incidencias`` reprocesa las que hayan quedado pendientes.
+"""
+import logging
+
+from django.core.mail import mail_admins
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Incidencia, Reserva
+from .placas import buscar_vehiculo, normalizar_placa
+from .servicios import bloquear_espacio
+from .tareas import ColaTrabajos
+
+logger = logging.getLogger(__name__)
+
+
+def _reserva_relacionada(incidencia):
+    hoy = timezone.localdate()
+    if incidencia.placa:
+        criterio = Q(placa=normalizar_placa(incidencia.placa))
+        vehiculo = buscar_vehiculo(incidencia.placa)
+        if vehiculo:
+            criterio |= Q(vehiculo_id=vehiculo.vehiculo_id)
+        reserva = Reserva.objects.filter(
+            criterio, parqueadero_id=incidencia.parqueadero_id, fecha=hoy,
+        ).order_by('-hora_inicio').first()
+        if reserva:
+            return reserva
+    if incidencia.espacio_id:
+        return Reserva.objects.filter(
+            espacio_id=incidencia.espacio_id,
+            fecha=hoy,
+            hora_entrada__isnull=False,
+            hora_salida__isnull=True,
+        ).first()
+    return None
+
+
+def procesar_incidencias(ids):
+    """Procesa un lote de incidencias. Devuelve los ids que fallaron."""
+    fallidas = []
+    procesadas = []
+    # Los usuarios pueden estar en otra base que la sede: prefetch en vez de JOIN
+    pendientes = (
+        Incidencia.objects.filter(id__in=ids, procesada_en__isnull=True)
+        .select_related('espacio')
+        .prefetch_related('reportado_por')
+    )
+    for incidencia in pendientes:
+        try:
+            if incidencia.reserva_id is None:
+                incidencia.reserva = _reserva_relacionada(incidencia)
+            if incidencia.tipo == 'DANIO_ESPACIO' and incidencia.espacio_id:
+                bloquear_espacio(incidencia.espacio_id)
+        except Exception:
+            logger.exception('No se pudo procesar la incidencia %s', incidencia.id)
+            fallidas.append(incidencia.id)
+            continue
+        procesadas.append(incidencia)
+
+    if not procesadas:
+        return fallidas
+
+    try:
+        _notificar(procesadas)
+    except Exception:
+        logger.exception('No se pudo notificar a los administradores')
+        return fallidas + [incidencia.id for incidencia in procesadas]
+
+    ahora = timezone.now()
+    for incidencia in procesadas:
+        incidencia.procesada_en = ahora
+    Incidencia.objects.bulk_update(procesadas, ['reserva', 'procesada_en'])
+    return fallidas
+
+
+def _notificar(incidencias):
+    lineas = []
+    for incidencia in incidencias:
+        espacio = f'espacio {incidencia.espacio.numero}' if incidencia.espacio else 'sin espacio'
+        reportado = incidencia.reportado_por.username if incidencia.reportado_por else '-'
+        lineas.append(
+            f'- [{incidencia.tipo}] {incidencia.placa or "sin placa"}, {espacio}, '
+            f'reportada por {reportado} a las {incidencia.fecha_hora:%H:%M}: {incidencia.descripcion}'
+        )
+    mail_admins(f'{len(incidencias)} incidencia(s) nueva(s) en MiParqueo', '\n'.join(lineas))
+
+
+cola_incidencias = ColaTrabajos('incidencias', procesar_incidencias)
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+from core.correo import enviar_pendientes
+
+class Command(BaseCommand):
+    help = 'Envía los correos pendientes de la bandeja de salida'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=50)
+        parser.add_argument('--continuo', action='store_true', help='No terminar; revisar la bandeja cada --intervalo segundos')
+        parser.add_argument('--intervalo', type=float, default=10.0)
+
+    def handle(self, *args, **options):
+        while True:
+            procesados, reintentar = enviar_pendientes(limite=options['lote'])
+            if procesados:
+                self.stdout.write(f'Lote: {procesados - len(reintentar)} enviado(s), {len(reintentar)} para reintentar.')
+                continue
+            if not options['continuo']:
+                break
+            time.sleep(options['intervalo'])
+        self.stdout.write(self.style.SUCCESS('Bandeja de salida procesada.'))
@@ -0,0 +1,103 @@
+import datetime
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from core.asignacion import espacios_libres
+from core.models import EspacioParqueadero, Parqueadero, Reserva
+from core.parqueaderos import usar_parqueadero
+
+class Command(BaseCommand):
+    help = ('Mide la latencia de las consultas frecuentes de una sede a medida que crece el número de sedes '
+            '(los datos generados se descartan al terminar)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sedes', type=int, nargs='+', default=[1, 10, 50],
+                            help='Cantidades de sedes a medir, en orden creciente')
+        parser.add_argument('--espacios', type=int, default=200, help='Espacios por sede')
+        parser.add_argument('--reservas', type=int, default=20000, help='Reservas por sede')
+        parser.add_argument('--dias', type=int, default=60, help='Días que cubren las reservas de cada sede')
+        parser.add_argument('--repeticiones', type=int, default=50)
+        parser.add_argument('--conservar', action='store_true', help='No descartar las sedes generadas')
+
+    def handle(self, *args, **options):
+        self.rnd = random.Random(1)
+        self.hoy = timezone.localdate()
+        self.usuario, _ = get_user_model().objects.get_or_create(username='medicion-sedes')
+
+        self.stdout.write(f"{'Sedes':>6} {'Consulta':22} {'p50 ms':>8} {'p95 ms':>8}")
+        with transaction.atomic():
+            sedes = []
+            for cantidad in sorted(options['sedes']):
+                while len(sedes) < cantidad:
+                    sedes.append(self._crear_sede(len(sedes), options))
+                # Siempre se mide la primera sede: sus datos no cambian entre rondas
+                with usar_parqueadero(sedes[0]):
+                    for nombre, consulta in self._consultas(sedes[0]):
+                        tiempos = self._medir(consulta, options['repeticiones'])
+                        self.stdout.write(f'{cantidad:>6} {nombre:22} {tiempos[0]:>8.2f} {tiempos[1]:>8.2f}')
+            if not options['conservar']:
+                transaction.set_rollback(True)
+
+    def _crear_sede(self, numero, options):
+        parqueadero = Parqueadero.objects.create(nombre=f'Medición {numero}', codigo=f'medicion-{numero}')
+        with usar_parqueadero(parqueadero):
+            espacios = EspacioParqueadero.objects.bulk_create([
+                EspacioParqueadero(parqueadero=parqueadero, numero=i, tipo='MOTO' if i % 4 == 0 else 'CARRO')
+                for i in range(1, options['espacios'] + 1)
+            ])
+            reservas = []
+            for i in range(options['reservas']):
+                espacio = self.rnd.choice(espacios)
+                hora = self.rnd.randint(6, 20)
+                fecha = self.hoy + datetime.timedelta(days=self.rnd.randint(-options['dias'] // 2, options['dias'] // 2))
+                entro = fecha == self.hoy and self.rnd.random() < 0.5
+                reservas.append(Reserva(
+                    parqueadero=parqueadero,
+                    usuario=self.usuario,
+                    espacio=espacio,
+                    fecha=fecha,
+                    hora_inicio=datetime.time(hora, 0),
+                    hora_fin=datetime.time(hora + 1, 0),
+                    tipo_vehiculo=espacio.tipo,
+                    placa=f'S{numero:03d}{i:06d}',
+                    estado='RESERVADA' if fecha >= self.hoy else 'COMPLETADA',
+                    hora_entrada=datetime.time(hora, 5) if entro else None,
+                ))
+            Reserva.objects.bulk_create(reservas, batch_size=5000)
+        return parqueadero
+
+    def _consultas(self, parqueadero):
+        hoy = self.hoy
+        espacio = EspacioParqueadero.objects.filter(parqueadero=parqueadero).order_by('numero').first()
+        placa = Reserva.objects.filter(parqueadero=parqueadero, fecha=hoy).values_list('placa', flat=True).first() or ''
+        return [
+            ('disponibilidad', lambda: list(
+                EspacioParqueadero.objects.filter(parqueadero=parqueadero).order_by('numero'))),
+            ('porteria (placa)', lambda: Reserva.objects.filter(
+                parqueadero=parqueadero, fecha=hoy, estado='RESERVADA', placa=placa,
+            ).select_related('espacio').first()),
+            ('salidas', lambda: list(Reserva.objects.filter(
+                parqueadero=parqueadero, fecha=hoy, hora_entrada__isnull=False, hora_salida__isnull=True,
+            ).select_related('espacio'))),
+            ('solapamiento', lambda: Reserva.objects.filter(
+                espacio=espacio, fecha=hoy, estado='RESERVADA',
+            ).filter(Q(hora_inicio__lt=datetime.time(11)) & Q(hora_fin__gt=datetime.time(10))).exists()),
+            ('espacios libres', lambda: list(espacios_libres(
+                hoy, 'CARRO', datetime.time(10), datetime.time(11), parqueadero=parqueadero,
+            ).values_list('id', flat=True))),
+        ]
+
+    @staticmethod
+    def _medir(consulta, repeticiones):
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            consulta()
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+        tiempos.sort()
+        return tiempos[len(tiempos) // 2], tiempos[min(len(tiempos) - 1, int(len(tiempos) * 0.95))]
@@ -0,0 +1,87 @@
+import time
+from urllib.parse import urlsplit
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import Resolver404, resolve
+
+from core.metricas import registro
+
+
+class Command(BaseCommand):
+    help = 'Ejecuta peticiones contra las rutas indicadas y reporta latencia, consultas SQL y plantillas por vista'
+
+    def add_arguments(self, parser):
+        parser.add_argument('rutas', nargs='+', help='Rutas a medir, ej: /cliente/disponibilidad/')
+        parser.add_argument('--usuario', help='Usuario con el que se inicia sesión antes de medir')
+        parser.add_argument('--repeticiones', type=int, default=20)
+        parser.add_argument('--formato', choices=['tabla', 'prometheus'], default='tabla')
+
+    def handle(self, *args, **options):
+        # Se fuerza la instrumentación aunque esté apagada en settings:
+        # el cliente crea su propio handler y con él la cadena de middleware.
+        with override_settings(METRICAS_ACTIVAS=True, ALLOWED_HOSTS=['*']):
+            cliente = Client()
+            if options['usuario']:
+                User = get_user_model()
+                try:
+                    cliente.force_login(User.objects.get(username=options['usuario']))
+                except User.DoesNotExist:
+                    raise CommandError(f"No existe el usuario {options['usuario']}.")
+
+            registro.reiniciar()
+            # Los percentiles de la tabla salen de estos tiempos, no de los
+            # buckets del histograma (que solo darían sus límites).
+            tiempos = {}
+            for ruta in options['rutas']:
+                medidos = tiempos.setdefault(self._vista(ruta), [])
+                for _ in range(options['repeticiones']):
+                    inicio = time.perf_counter()
+                    cliente.get(ruta)
+                    medidos.append(time.perf_counter() - inicio)
+
+        if options['formato'] == 'prometheus':
+            self.stdout.write(registro.prometheus())
+            return
+
+        self.stdout.write('Latencia medida por petición (incluye el cliente de pruebas); SQL, DB y plantillas son promedios.')
+        self.stdout.write(f"{'Vista':40} {'N':>5} {'p50 ms':>8} {'p95 ms':>8} {'SQL/pet':>8} {'DB ms':>8} {'Plant. ms':>10}")
+        for vista, hist in sorted(registro.latencia.items()):
+            consultas = registro.consultas[vista]
+            db = registro.tiempo_db[vista]
+            plantillas = registro.plantillas.get(vista)
+            plant_ms = plantillas.suma / plantillas.total * 1000 if plantillas else 0.0
+            medidos = sorted(tiempos.get(vista, []))
+            if medidos:
+                p50, p95 = self._percentil(medidos, 0.5), self._percentil(medidos, 0.95)
+            else:
+                # Sin tiempos propios: estimación interpolada del histograma
+                p50, p95 = hist.percentil(0.5), hist.percentil(0.95)
+            self.stdout.write(
+                f'{vista:40} {hist.total:>5} {p50 * 1000:>8.1f} {p95 * 1000:>8.1f} '
+                f'{consultas.suma / consultas.total:>8.1f} {db.suma / db.total * 1000:>8.2f} {plant_ms:>10.2f}'
+            )
+
+        if registro.consultas_lentas:
+            self.stdout.write('')
+            self.stdout.write(self.style.WARNING('Consultas lentas:'))
+            for muestra in registro.consultas_lentas:
+                self.stdout.write(f"  {muestra['duracion'] * 1000:8.1f} ms  {muestra['vista']}  {muestra['sql']}")
+
+    @staticmethod
+    def _vista(ruta):
+        try:
+            return resolve(urlsplit(ruta).path).view_name
+        except Resolver404:
+            return 'sin_ruta'
+
+    @staticmethod
+    def _percentil(ordenados, q):
+        """Percentil ``q`` (0-1) con interpolación lineal entre muestras ordenadas."""
+        posicion = (len(ordenados) - 1) * q
+        i = int(posicion)
+        if i + 1 >= len(ordenados):
+            return ordenados[-1]
+        return ordenados[i] + (ordenados[i + 1] - ordenados[i]) * (posicion - i)
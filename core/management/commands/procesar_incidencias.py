@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from core.incidencias import procesar_incidencias
+from core.models import Incidencia
+from core.parqueaderos import sedes, usar_parqueadero
+
+class Command(BaseCommand):
+    help = 'Procesa las incidencias que quedaron pendientes (enlace de reserva, bloqueo de espacio y aviso)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=50)
+
+    def handle(self, *args, **options):
+        total = 0
+        fallidas = []
+        for parqueadero in sedes().values():
+            with usar_parqueadero(parqueadero):
+                ids = list(
+                    Incidencia.objects.filter(parqueadero=parqueadero, procesada_en__isnull=True)
+                    .order_by('id').values_list('id', flat=True)
+                )
+                for i in range(0, len(ids), options['lote']):
+                    fallidas += procesar_incidencias(ids[i:i + options['lote']])
+            total += len(ids)
+
+        self.stdout.write(self.style.SUCCESS(f'Incidencias procesadas: {total - len(fallidas)}.'))
+        if fallidas:
+            self.stdout.write(self.style.WARNING(f'Fallaron: {fallidas}'))
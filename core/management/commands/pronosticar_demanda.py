@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from core.pronostico import (NumpyNoDisponible, SEMANAS_MAXIMAS, TIPOS, calcular_pronostico, capacidad_actual,
+                             maximo_por_tipo, proxima_semana)
+
+class Command(BaseCommand):
+    help = 'Pronostica los espacios necesarios por tipo y hora para la próxima semana'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--semanas', type=int, default=52, help=f'Semanas de historial a usar (máximo {SEMANAS_MAXIMAS})')
+        parser.add_argument('--percentil', type=float, default=90, help='Percentil de ocupación a cubrir')
+        parser.add_argument('--bloque', type=int, default=50000, help='Filas leídas por bloque')
+
+    def handle(self, *args, **options):
+        if not 1 <= options['semanas'] <= SEMANAS_MAXIMAS:
+            raise CommandError(f'--semanas debe estar entre 1 y {SEMANAS_MAXIMAS}.')
+        if not 0 <= options['percentil'] <= 100:
+            raise CommandError('--percentil debe estar entre 0 y 100.')
+        if options['bloque'] < 1:
+            raise CommandError('--bloque debe ser al menos 1.')
+        inicio = time.perf_counter()
+        try:
+            pronostico = calcular_pronostico(
+                semanas=options['semanas'], percentil=options['percentil'], tamano_bloque=options['bloque'],
+            )
+        except NumpyNoDisponible as error:
+            raise CommandError(str(error))
+        duracion = time.perf_counter() - inicio
+
+        self.stdout.write(
+            f"Historial: {pronostico['reservas']} reservas en {pronostico['dias_historial']} días "
+            f"(calculado en {duracion:.2f} s, percentil {pronostico['percentil']:g})."
+        )
+        semana = proxima_semana(pronostico)
+        for fecha, horas in semana:
+            self.stdout.write('')
+            self.stdout.write(self.style.MIGRATE_HEADING(f'{fecha:%A %Y-%m-%d}'))
+            if not horas:
+                self.stdout.write('  Sin demanda prevista.')
+                continue
+            self.stdout.write('  Hora   ' + ''.join(f'{tipo:>14}' for tipo in TIPOS))
+            for hora, valores in horas:
+                self.stdout.write(f'  {hora:02d}:00  ' + ''.join(f'{valores[tipo]:>14}' for tipo in TIPOS))
+
+        self.stdout.write('')
+        capacidad = capacidad_actual()
+        for tipo, maximo in maximo_por_tipo(semana).items():
+            linea = f'{tipo}: pico previsto {maximo}, espacios actuales {capacidad[tipo]}'
+            self.stdout.write(self.style.WARNING(linea) if maximo > capacidad[tipo] else linea)
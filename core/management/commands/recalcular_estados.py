@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from core.models import EspacioParqueadero
+from core.parqueaderos import sedes, usar_parqueadero
+from core.servicios import recalcular_estados
+
+class Command(BaseCommand):
+    help = 'Recalcula el estado de todos los espacios a partir de sus reservas'
+
+    def handle(self, *args, **kwargs):
+        cambiados = 0
+        for parqueadero in sedes().values():
+            with usar_parqueadero(parqueadero):
+                ids = EspacioParqueadero.objects.filter(parqueadero=parqueadero).values_list('id', flat=True)
+                cambiados += recalcular_estados(list(ids))
+        self.stdout.write(self.style.SUCCESS(f'Estados recalculados. Espacios modificados: {cambiados}.'))
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from core.porteria import pendientes, sincronizar
+
+class Command(BaseCommand):
+    help = 'Aplica a la base de datos los eventos del diario de portería (entradas y salidas)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--archivo', help='Diario de otra portería a aplicar (no modifica la posición local)')
+        parser.add_argument('--desde-inicio', action='store_true',
+                            help='Releer todo el diario local; los eventos ya aplicados se saltan')
+        parser.add_argument('--pendientes', action='store_true', help='Solo listar los eventos sin sincronizar')
+        parser.add_argument('--continuo', action='store_true', help='No terminar; sincronizar cada --intervalo segundos')
+        parser.add_argument('--intervalo', type=float, default=5.0)
+
+    def handle(self, *args, **options):
+        if options['pendientes']:
+            eventos = pendientes()
+            for evento in eventos:
+                self.stdout.write(f"{evento['ocurrido_en']}  {evento['tipo']:8} reserva {evento['reserva_id']}  {evento['uuid']}")
+            self.stdout.write(f'{len(eventos)} evento(s) pendiente(s).')
+            return
+
+        if options['archivo'] and options['continuo']:
+            raise CommandError('--continuo no se puede usar con --archivo.')
+
+        desde = 0 if options['desde_inicio'] else None
+        while True:
+            try:
+                total = sincronizar(ruta=options['archivo'], desde=desde)
+            except FileNotFoundError:
+                raise CommandError(f"No existe el archivo {options['archivo']}.")
+            if any(total.values()):
+                self.stdout.write(
+                    f"Aplicados: {total['APLICADO']}, conflictos: {total['CONFLICTO']}, "
+                    f"ya aplicados antes: {total['REPETIDO']}."
+                )
+            if not options['continuo']:
+                break
+            desde = None
+            time.sleep(options['intervalo'])
+        self.stdout.write(self.style.SUCCESS('Diario de portería sincronizado.'))
@@ -1,15 +1,25 @@
 from django.core.management.base import BaseCommand
-from core.models import EspacioParqueadero
+from core.models import EspacioParqueadero, Parqueadero
 
 class Command(BaseCommand):
     help = 'Popula la base de datos con espacios de parqueadero iniciales'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--parqueadero', help='Código de la sede (se crea si no existe); por defecto la principal')
+
     def handle(self, *args, **kwargs):
-        self.stdout.write('Creando espacios de parqueadero...')
+        if kwargs['parqueadero']:
+            parqueadero, _ = Parqueadero.objects.get_or_create(
+                codigo=kwargs['parqueadero'], defaults={'nombre': kwargs['parqueadero']},
+            )
+        else:
+            parqueadero = Parqueadero.principal()
+        self.stdout.write(f'Creando espacios de parqueadero en {parqueadero}...')
         
         # Crear 10 espacios para CARRO
         for i in range(1, 11):
             EspacioParqueadero.objects.get_or_create(
+                parqueadero=parqueadero,
                 numero=i,
                 defaults={'tipo': 'CARRO', 'estado': 'LIBRE'}
             )
@@ -17,8 +27,17 @@ class Command(BaseCommand):
         # Crear 10 espacios para MOTO
         for i in range(11, 21):
             EspacioParqueadero.objects.get_or_create(
+                parqueadero=parqueadero,
                 numero=i,
                 defaults={'tipo': 'MOTO', 'estado': 'LIBRE'}
             )
 
+        # Crear 2 espacios preferenciales DISCAPACIDAD
+        for i in range(21, 23):
+            EspacioParqueadero.objects.get_or_create(
+                parqueadero=parqueadero,
+                numero=i,
+                defaults={'tipo': 'DISCAPACIDAD', 'estado': 'LIBRE'}
+            )
+
         self.stdout.write(self.style.SUCCESS('Espacios creados exitosamente.'))
@@ -0,0 +1,64 @@
+import datetime
+import random
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from core.models import EspacioParqueadero, Reserva
+from core.servicios import recalcular_estados
+
+class Command(BaseCommand):
+    help = 'Genera un historial masivo de reservas para pruebas de rendimiento (admin, pronóstico)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cantidad', type=int, default=100000)
+        parser.add_argument('--usuarios', type=int, default=200, help='Usuarios de prueba a crear/usar')
+        parser.add_argument('--dias', type=int, default=730, help='Días hacia atrás que cubre el historial')
+        parser.add_argument('--lote', type=int, default=5000)
+        parser.add_argument('--semilla', type=int, default=1)
+
+    def handle(self, *args, **options):
+        espacios = list(EspacioParqueadero.objects.values_list('id', 'tipo', 'parqueadero_id'))
+        if not espacios:
+            raise CommandError('No hay espacios. Ejecute primero seed_espacios.')
+
+        User = get_user_model()
+        usuarios = []
+        for i in range(options['usuarios']):
+            usuario, _ = User.objects.get_or_create(username=f'carga{i:04d}')
+            usuarios.append(usuario.id)
+
+        rnd = random.Random(options['semilla'])
+        hoy = datetime.date.today()
+        letras = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+        creadas = 0
+        self.stdout.write(f"Creando {options['cantidad']} reservas...")
+        while creadas < options['cantidad']:
+            lote = []
+            for _ in range(min(options['lote'], options['cantidad'] - creadas)):
+                espacio_id, tipo, parqueadero_id = rnd.choice(espacios)
+                hora = rnd.randint(6, 20)
+                fecha = hoy - datetime.timedelta(days=rnd.randint(1, options['dias']))
+                asistio = rnd.random() < 0.85
+                lote.append(Reserva(
+                    usuario_id=rnd.choice(usuarios),
+                    espacio_id=espacio_id,
+                    parqueadero_id=parqueadero_id,
+                    fecha=fecha,
+                    hora_inicio=datetime.time(hora, rnd.choice((0, 15, 30, 45))),
+                    hora_fin=datetime.time(min(hora + rnd.randint(1, 3), 23), 0),
+                    tipo_vehiculo=tipo,
+                    placa=''.join(rnd.choices(letras, k=3)) + f'{rnd.randint(0, 999):03d}',
+                    estado='COMPLETADA' if asistio else 'VENCIDA',
+                    hora_entrada=datetime.time(hora, 0) if asistio else None,
+                ))
+            # bulk_create no dispara señales: el estado de los espacios se recalcula al final
+            Reserva.objects.bulk_create(lote)
+            creadas += len(lote)
+            self.stdout.write(f'  {creadas}')
+
+        recalcular_estados()
+        with connection.cursor() as cursor:
+            # Actualizar estadísticas del planificador (y del conteo estimado)
+            cursor.execute('ANALYZE')
+        self.stdout.write(self.style.SUCCESS(f'{creadas} reservas creadas.'))
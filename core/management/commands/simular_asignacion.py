@@ -0,0 +1,66 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from core.asignacion import IndiceIntervalos, elegir_espacio
+
+# Ventana operativa usada para medir la utilización (06:00 - 22:00)
+APERTURA = 6 * 60
+CIERRE = 22 * 60
+
+class Command(BaseCommand):
+    help = 'Simula solicitudes de reserva y compara la asignación best-fit contra first-fit (utilización y latencia)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--carros', type=int, default=40)
+        parser.add_argument('--motos', type=int, default=15)
+        parser.add_argument('--discapacidad', type=int, default=5)
+        parser.add_argument('--solicitudes', type=int, default=600, help='Solicitudes por día simulado')
+        parser.add_argument('--dias', type=int, default=20)
+        parser.add_argument('--semilla', type=int, default=1)
+
+    def handle(self, *args, **options):
+        espacios = []
+        for tipo, cantidad in (('CARRO', options['carros']), ('MOTO', options['motos']),
+                               ('DISCAPACIDAD', options['discapacidad'])):
+            for _ in range(cantidad):
+                espacios.append((len(espacios) + 1, len(espacios) + 1, tipo))
+
+        rnd = random.Random(options['semilla'])
+        dias = [self._solicitudes(rnd, options['solicitudes']) for _ in range(options['dias'])]
+
+        self.stdout.write(f"{'Estrategia':12} {'Aceptadas':>10} {'Rechazadas':>11} {'Utilización':>12} {'µs/decisión':>12} {'p99 µs':>8}")
+        for estrategia in ('first_fit', 'best_fit'):
+            aceptadas = rechazadas = minutos_reservados = 0
+            latencias = []
+            for solicitudes in dias:
+                indice = IndiceIntervalos(espacios)
+                for tipo, inicio, fin in solicitudes:
+                    t0 = time.perf_counter()
+                    espacio_id = elegir_espacio(indice, tipo, inicio, fin, estrategia=estrategia)
+                    latencias.append(time.perf_counter() - t0)
+                    if espacio_id is None:
+                        rechazadas += 1
+                        continue
+                    indice.agregar(espacio_id, inicio, fin)
+                    aceptadas += 1
+                    minutos_reservados += fin - inicio
+
+            capacidad = len(espacios) * (CIERRE - APERTURA) * len(dias)
+            latencias.sort()
+            media = sum(latencias) / len(latencias) * 1e6
+            p99 = latencias[int(len(latencias) * 0.99)] * 1e6
+            self.stdout.write(
+                f'{estrategia:12} {aceptadas:>10} {rechazadas:>11} {minutos_reservados / capacidad:>11.1%} '
+                f'{media:>12.1f} {p99:>8.1f}'
+            )
+
+    @staticmethod
+    def _solicitudes(rnd, cantidad):
+        solicitudes = []
+        for _ in range(cantidad):
+            tipo = rnd.choices(['CARRO', 'MOTO', 'DISCAPACIDAD'], weights=[70, 20, 10])[0]
+            duracion = rnd.randint(2, 16) * 15
+            inicio = rnd.randrange(APERTURA, CIERRE - duracion + 1, 15)
+            solicitudes.append((tipo, inicio, inicio + duracion))
+        return solicitudes
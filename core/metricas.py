@@ -0,0 +1,326 @@
+"""
+Instrumentación de rendimiento de MiParqueo.
+
+Recolecta, por nombre de URL (``core:disponibilidad``, ``admin:index``...):
+- Histograma de latencia de la petición.
+- Número de consultas SQL y tiempo de base de datos por petición.
+- Tiempo de renderizado de plantillas.
+- Muestras de consultas lentas con el SQL normalizado.
+
+Los datos viven en memoria del proceso (``registro``) y se exponen en formato
+texto de Prometheus (vista ``core:metricas``) y con ``manage.py metricas``.
+Con ``METRICAS_ACTIVAS = False`` el middleware se descarta al arrancar y no
+se instala ningún envoltorio, por lo que el costo es prácticamente nulo.
+"""
+import logging
+import re
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.backends.django import DjangoTemplates
+
+logger = logging.getLogger(__name__)
+
+# Límites (en segundos) de los histogramas de tiempo
+BUCKETS_TIEMPO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Límites de consultas por petición
+BUCKETS_CONSULTAS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def metricas_activas():
+    return getattr(settings, 'METRICAS_ACTIVAS', False)
+
+
+# --- Normalización de SQL ---
+
+_RE_CADENA = re.compile(r"'(?:[^']|'')*'")
+_RE_NUMERO = re.compile(r"\b\d+(?:\.\d+)?\b")
+_RE_LISTA = re.compile(r"\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)")
+_RE_ESPACIOS = re.compile(r"\s+")
+
+
+def normalizar_sql(sql):
+    """
+    Reemplaza literales por ``?`` y colapsa listas ``IN (...)`` para que
+    consultas iguales con distintos parámetros compartan la misma huella.
+    """
+    sql = _RE_CADENA.sub('?', sql)
+    sql = _RE_NUMERO.sub('?', sql)
+    sql = _RE_LISTA.sub('(...)', sql)
+    return _RE_ESPACIOS.sub(' ', sql).strip()
+
+
+# --- Estructuras de datos ---
+
+class Histograma:
+    """Histograma acumulativo compatible con el formato de Prometheus."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.conteos = [0] * (len(buckets) + 1)  # el último es +Inf
+        self.suma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        for i, limite in enumerate(self.buckets):
+            if valor <= limite:
+                self.conteos[i] += 1
+                break
+        else:
+            self.conteos[-1] += 1
+        self.suma += valor
+        self.total += 1
+
+    def percentil(self, q):
+        """
+        Estimación del percentil ``q`` (0-1) interpolando linealmente dentro
+        del bucket que lo contiene (como ``histogram_quantile`` de Prometheus).
+        Si cae en +Inf se devuelve el último límite.
+        """
+        if not self.total:
+            return 0.0
+        objetivo = q * self.total
+        acumulado = 0
+        for i, conteo in enumerate(self.conteos):
+            if conteo and acumulado + conteo >= objetivo:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                inferior = self.buckets[i - 1] if i else 0.0
+                return inferior + (self.buckets[i] - inferior) * (objetivo - acumulado) / conteo
+            acumulado += conteo
+        return self.buckets[-1]
+
+
+class Medicion:
+    """Datos de una sola petición, acumulados mientras se atiende."""
+
+    __slots__ = ('vista', 'consultas', 'tiempo_db', 'tiempo_plantillas')
+
+    def __init__(self):
+        self.vista = None
+        self.consultas = 0
+        self.tiempo_db = 0.0
+        self.tiempo_plantillas = 0.0
+
+
+_medicion_actual = ContextVar('medicion_actual', default=None)
+
+
+class Registro:
+    """Almacén en memoria de todas las métricas del proceso."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reiniciar()
+
+    def reiniciar(self):
+        with self._lock:
+            self.latencia = {}
+            self.consultas = {}
+            self.tiempo_db = {}
+            self.plantillas = {}
+            self.peticiones = {}
+            self.consultas_lentas = deque(maxlen=getattr(settings, 'METRICAS_MUESTRAS_LENTAS', 50))
+            self.contadores = {}
+            self.medidores = {}
+            self.ayudas = {}
+
+    def registrar_peticion(self, medicion, duracion, status):
+        vista = medicion.vista or 'sin_ruta'
+        with self._lock:
+            self._hist(self.latencia, vista, BUCKETS_TIEMPO).observar(duracion)
+            self._hist(self.consultas, vista, BUCKETS_CONSULTAS).observar(medicion.consultas)
+            self._hist(self.tiempo_db, vista, BUCKETS_TIEMPO).observar(medicion.tiempo_db)
+            if medicion.tiempo_plantillas:
+                self._hist(self.plantillas, vista, BUCKETS_TIEMPO).observar(medicion.tiempo_plantillas)
+            clave = (vista, str(status))
+            self.peticiones[clave] = self.peticiones.get(clave, 0) + 1
+
+    def registrar_consulta_lenta(self, vista, sql, duracion):
+        muestra = {
+            'vista': vista or 'sin_ruta',
+            'sql': normalizar_sql(sql),
+            'duracion': duracion,
+        }
+        with self._lock:
+            self.consultas_lentas.append(muestra)
+        logger.warning('Consulta lenta (%.1f ms) en %s: %s', duracion * 1000, muestra['vista'], muestra['sql'])
+
+    def incrementar(self, nombre, valor=1, ayuda='', **etiquetas):
+        """Contador genérico para otros componentes (caché, colas...)."""
+        clave = tuple(sorted(etiquetas.items()))
+        with self._lock:
+            serie = self.contadores.setdefault(nombre, {})
+            serie[clave] = serie.get(clave, 0) + valor
+            if ayuda:
+                self.ayudas[nombre] = ayuda
+
+    def fijar(self, nombre, valor, ayuda='', **etiquetas):
+        """Medidor (gauge) genérico."""
+        clave = tuple(sorted(etiquetas.items()))
+        with self._lock:
+            self.medidores.setdefault(nombre, {})[clave] = valor
+            if ayuda:
+                self.ayudas[nombre] = ayuda
+
+    @staticmethod
+    def _hist(tabla, vista, buckets):
+        hist = tabla.get(vista)
+        if hist is None:
+            hist = tabla[vista] = Histograma(buckets)
+        return hist
+
+    # --- Exportación ---
+
+    def prometheus(self):
+        """Devuelve todas las métricas en formato de texto de Prometheus."""
+        lineas = []
+        with self._lock:
+            self._exportar_hist(lineas, 'miparqueo_request_duration_seconds',
+                                'Latencia de las peticiones por vista.', self.latencia)
+            self._exportar_hist(lineas, 'miparqueo_db_queries_per_request',
+                                'Consultas SQL por petición.', self.consultas)
+            self._exportar_hist(lineas, 'miparqueo_db_duration_seconds',
+                                'Tiempo de base de datos por petición.', self.tiempo_db)
+            self._exportar_hist(lineas, 'miparqueo_template_render_seconds',
+                                'Tiempo de renderizado de plantillas por petición.', self.plantillas)
+
+            lineas.append('# HELP miparqueo_requests_total Peticiones atendidas por vista y código.')
+            lineas.append('# TYPE miparqueo_requests_total counter')
+            for (vista, status), total in sorted(self.peticiones.items()):
+                lineas.append(f'miparqueo_requests_total{{vista="{vista}",status="{status}"}} {total}')
+
+            lentas = {}
+            for muestra in self.consultas_lentas:
+                lentas[muestra['vista']] = lentas.get(muestra['vista'], 0) + 1
+            lineas.append('# HELP miparqueo_db_slow_query_samples Muestras de consultas lentas retenidas por vista.')
+            lineas.append('# TYPE miparqueo_db_slow_query_samples gauge')
+            for vista, total in sorted(lentas.items()):
+                lineas.append(f'miparqueo_db_slow_query_samples{{vista="{vista}"}} {total}')
+
+            self._exportar_series(lineas, self.contadores, 'counter')
+            self._exportar_series(lineas, self.medidores, 'gauge')
+        return '\n'.join(lineas) + '\n'
+
+    @staticmethod
+    def _exportar_hist(lineas, nombre, ayuda, tabla):
+        lineas.append(f'# HELP {nombre} {ayuda}')
+        lineas.append(f'# TYPE {nombre} histogram')
+        for vista, hist in sorted(tabla.items()):
+            acumulado = 0
+            for limite, conteo in zip(hist.buckets, hist.conteos):
+                acumulado += conteo
+                lineas.append(f'{nombre}_bucket{{vista="{vista}",le="{limite}"}} {acumulado}')
+            lineas.append(f'{nombre}_bucket{{vista="{vista}",le="+Inf"}} {hist.total}')
+            lineas.append(f'{nombre}_sum{{vista="{vista}"}} {hist.suma:.6f}')
+            lineas.append(f'{nombre}_count{{vista="{vista}"}} {hist.total}')
+
+    def _exportar_series(self, lineas, series, tipo):
+        for nombre, valores in sorted(series.items()):
+            if nombre in self.ayudas:
+                lineas.append(f'# HELP {nombre} {self.ayudas[nombre]}')
+            lineas.append(f'# TYPE {nombre} {tipo}')
+            for clave, valor in sorted(valores.items()):
+                etiquetas = ','.join(f'{k}="{v}"' for k, v in clave)
+                sufijo = f'{{{etiquetas}}}' if etiquetas else ''
+                lineas.append(f'{nombre}{sufijo} {valor}')
+
+
+registro = Registro()
+
+
+# --- Ganchos ---
+
+def _envoltorio_sql(execute, sql, params, many, context):
+    """``connection.execute_wrapper``: cuenta y cronometra cada consulta."""
+    medicion = _medicion_actual.get()
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duracion = time.perf_counter() - inicio
+        if medicion is not None:
+            medicion.consultas += 1
+            medicion.tiempo_db += duracion
+        if duracion * 1000 >= getattr(settings, 'METRICAS_CONSULTA_LENTA_MS', 100):
+            registro.registrar_consulta_lenta(medicion and medicion.vista, sql, duracion)
+
+
+class MetricasMiddleware:
+    """
+    Mide cada petición: latencia total, consultas SQL y plantillas.
+    Si ``METRICAS_ACTIVAS`` es False Django lo retira de la cadena.
+    """
+
+    def __init__(self, get_response):
+        if not metricas_activas():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        medicion = Medicion()
+        token = _medicion_actual.set(medicion)
+        inicio = time.perf_counter()
+        status = 500
+        try:
+            with ExitStack() as pila:
+                for conexion in connections.all():
+                    pila.enter_context(conexion.execute_wrapper(_envoltorio_sql))
+                response = self.get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            duracion = time.perf_counter() - inicio
+            _medicion_actual.reset(token)
+            registro.registrar_peticion(medicion, duracion, status)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        medicion = _medicion_actual.get()
+        if medicion is not None and request.resolver_match:
+            medicion.vista = request.resolver_match.view_name
+
+
+# --- Plantillas ---
+
+class _PlantillaMedida:
+    """Envuelve una plantilla del backend para cronometrar ``render``."""
+
+    def __init__(self, plantilla):
+        self.plantilla = plantilla
+        self.template = plantilla.template
+
+    @property
+    def origin(self):
+        return self.plantilla.origin
+
+    def render(self, context=None, request=None):
+        medicion = _medicion_actual.get()
+        if medicion is None:
+            return self.plantilla.render(context, request)
+        inicio = time.perf_counter()
+        try:
+            return self.plantilla.render(context, request)
+        finally:
+            medicion.tiempo_plantillas += time.perf_counter() - inicio
+
+
+class PlantillasInstrumentadas(DjangoTemplates):
+    """Backend de plantillas de Django que además mide el tiempo de render."""
+
+    def from_string(self, template_code):
+        return self._envolver(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return self._envolver(super().get_template(template_name))
+
+    @staticmethod
+    def _envolver(plantilla):
+        if not metricas_activas():
+            return plantilla
+        return _PlantillaMedida(plantilla)
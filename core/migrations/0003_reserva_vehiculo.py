@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_vehiculo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reserva',
+            name='vehiculo',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='reservas', to='core.vehiculo'),
+        ),
+    ]
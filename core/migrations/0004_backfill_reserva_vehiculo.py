@@ -0,0 +1,50 @@
+import re
+
+from django.db import migrations
+
+
+def normalizar_placa(placa):
+    # Copia de core.placas.normalizar_placa al momento de esta migración
+    return re.sub(r'[\s\-.]+', '', placa or '').upper()
+
+
+def normalizar_y_enlazar(apps, schema_editor):
+    Vehiculo = apps.get_model('core', 'Vehiculo')
+    Reserva = apps.get_model('core', 'Reserva')
+
+    # 1) Placas de vehículos en formato normalizado (si no colisiona con otra)
+    vehiculos = {}
+    for vehiculo in Vehiculo.objects.order_by('id'):
+        placa = normalizar_placa(vehiculo.placa)
+        if placa in vehiculos:
+            continue
+        if placa != vehiculo.placa:
+            vehiculo.placa = placa
+            vehiculo.save(update_fields=['placa'])
+        vehiculos[placa] = vehiculo.id
+
+    # 2) Placas de reservas normalizadas y enlazadas a su vehículo
+    pendientes = []
+    for reserva in Reserva.objects.only('id', 'placa', 'vehiculo_id').iterator(chunk_size=2000):
+        placa = normalizar_placa(reserva.placa)
+        vehiculo_id = vehiculos.get(placa)
+        if placa != reserva.placa or vehiculo_id != reserva.vehiculo_id:
+            reserva.placa = placa
+            reserva.vehiculo_id = vehiculo_id
+            pendientes.append(reserva)
+        if len(pendientes) >= 2000:
+            Reserva.objects.bulk_update(pendientes, ['placa', 'vehiculo'])
+            pendientes = []
+    if pendientes:
+        Reserva.objects.bulk_update(pendientes, ['placa', 'vehiculo'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_reserva_vehiculo'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalizar_y_enlazar, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_backfill_reserva_vehiculo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='incidencia',
+            name='placa',
+            field=models.CharField(blank=True, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='incidencia',
+            name='procesada_en',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='incidencia',
+            name='reserva',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='incidencias', to='core.reserva'),
+        ),
+    ]
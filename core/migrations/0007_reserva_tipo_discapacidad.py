@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_correosaliente'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='reserva',
+            name='tipo_vehiculo',
+            field=models.CharField(choices=[('CARRO', 'CARRO'), ('MOTO', 'MOTO'), ('DISCAPACIDAD', 'DISCAPACIDAD')], max_length=20),
+        ),
+    ]
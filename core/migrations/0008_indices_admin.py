@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_reserva_tipo_discapacidad'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='incidencia',
+            name='fecha_hora',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='incidencia',
+            name='placa',
+            field=models.CharField(blank=True, db_index=True, max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='reserva',
+            name='placa',
+            field=models.CharField(db_index=True, max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='reserva',
+            index=models.Index(fields=['fecha', 'estado'], name='core_reserv_fecha_752ecf_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reserva',
+            index=models.Index(fields=['espacio', 'fecha'], name='core_reserv_espacio_46d503_idx'),
+        ),
+    ]
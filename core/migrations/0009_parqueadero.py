@@ -0,0 +1,112 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:15
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def crear_sede_principal(apps, schema_editor):
+    """Todo lo existente pasa a la sede "Principal", con los vigilantes actuales."""
+    Parqueadero = apps.get_model('core', 'Parqueadero')
+    Group = apps.get_model('auth', 'Group')
+    db = schema_editor.connection.alias
+
+    principal, _ = Parqueadero.objects.using(db).get_or_create(codigo='principal', defaults={'nombre': 'Principal'})
+    for nombre in ('EspacioParqueadero', 'Reserva', 'Incidencia'):
+        apps.get_model('core', nombre).objects.using(db).filter(parqueadero__isnull=True).update(parqueadero=principal)
+    vigilantes = Group.objects.using(db).filter(name='VIGILANTE').first()
+    if vigilantes is not None:
+        principal.vigilantes.add(*vigilantes.user_set.all())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('core', '0008_indices_admin'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Parqueadero',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=100)),
+                ('codigo', models.SlugField(max_length=30, unique=True)),
+                ('direccion', models.CharField(blank=True, max_length=200)),
+                ('base_datos', models.CharField(default='default', max_length=50)),
+                ('vigilantes', models.ManyToManyField(blank=True, related_name='parqueaderos_vigilados', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='espacioparqueadero',
+            name='parqueadero',
+            field=models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='espacios', to='core.parqueadero'),
+        ),
+        migrations.AddField(
+            model_name='incidencia',
+            name='parqueadero',
+            field=models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='incidencias', to='core.parqueadero'),
+        ),
+        migrations.AddField(
+            model_name='reserva',
+            name='parqueadero',
+            field=models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='reservas', to='core.parqueadero'),
+        ),
+        migrations.RunPython(crear_sede_principal, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='espacioparqueadero',
+            name='parqueadero',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.PROTECT, related_name='espacios', to='core.parqueadero'),
+        ),
+        migrations.AlterField(
+            model_name='incidencia',
+            name='parqueadero',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.PROTECT, related_name='incidencias', to='core.parqueadero'),
+        ),
+        migrations.AlterField(
+            model_name='reserva',
+            name='parqueadero',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.PROTECT, related_name='reservas', to='core.parqueadero'),
+        ),
+        migrations.AlterField(
+            model_name='espacioparqueadero',
+            name='numero',
+            field=models.IntegerField(),
+        ),
+        migrations.AddConstraint(
+            model_name='espacioparqueadero',
+            constraint=models.UniqueConstraint(fields=('parqueadero', 'numero'), name='espacio_numero_unico_por_parqueadero'),
+        ),
+        migrations.AlterField(
+            model_name='incidencia',
+            name='reportado_por',
+            field=models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='reserva',
+            name='usuario',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='reservas', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='reserva',
+            name='vehiculo',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='reservas', to='core.vehiculo'),
+        ),
+        migrations.RemoveIndex(
+            model_name='reserva',
+            name='core_reserv_fecha_752ecf_idx',
+        ),
+        migrations.AddIndex(
+            model_name='reserva',
+            index=models.Index(fields=['parqueadero', 'fecha', 'estado'], name='core_reserv_parquea_aab74f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='incidencia',
+            index=models.Index(fields=['parqueadero', 'fecha_hora'], name='core_incide_parquea_8dbab8_idx'),
+        ),
+    ]
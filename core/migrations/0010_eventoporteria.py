@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:21
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_parqueadero'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventoPorteria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('uuid', models.UUIDField(unique=True)),
+                ('tipo', models.CharField(choices=[('ENTRADA', 'ENTRADA'), ('SALIDA', 'SALIDA')], max_length=10)),
+                ('ocurrido_en', models.DateTimeField()),
+                ('aplicado_en', models.DateTimeField(auto_now_add=True)),
+                ('resultado', models.CharField(choices=[('APLICADO', 'APLICADO'), ('CONFLICTO', 'CONFLICTO')], max_length=10)),
+                ('detalle', models.CharField(blank=True, max_length=255)),
+                ('parqueadero', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.PROTECT, related_name='eventos_porteria', to='core.parqueadero')),
+                ('reserva', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='eventos_porteria', to='core.reserva')),
+                ('vigilante', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:32
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_eventoporteria'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reserva',
+            index=models.Index(condition=models.Q(('estado', 'RESERVADA'), ('hora_entrada__isnull', False), ('hora_salida__isnull', True)), fields=['parqueadero'], name='reserva_entrada_abierta'),
+        ),
+    ]
@@ -1,6 +1,42 @@
 from django.db import models
 from django.conf import settings
 from django.core.exceptions import ValidationError
+from django.utils import timezone
+
+from .placas import normalizar_placa
+
+# 0) Modelo Parqueadero (sede)
+class Parqueadero(models.Model):
+    nombre = models.CharField(max_length=100)
+    codigo = models.SlugField(max_length=30, unique=True)
+    direccion = models.CharField(max_length=200, blank=True)
+    # Alias de settings.DATABASES donde viven los espacios, reservas e
+    # incidencias de la sede (ver core.parqueaderos.EnrutadorParqueaderos)
+    base_datos = models.CharField(max_length=50, default='default')
+    vigilantes = models.ManyToManyField(settings.AUTH_USER_MODEL, blank=True, related_name='parqueaderos_vigilados')
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return self.nombre
+
+    @classmethod
+    def principal(cls):
+        """Sede por defecto; las instalaciones de un solo parqueadero usan solo esta."""
+        parqueadero, _ = cls.objects.get_or_create(codigo='principal', defaults={'nombre': 'Principal'})
+        return parqueadero
+
+
+def _asignar_parqueadero(instancia):
+    if instancia.parqueadero_id is None:
+        from .parqueaderos import parqueadero_actual
+        instancia.parqueadero = parqueadero_actual() or Parqueadero.principal()
+
+
+# Las relaciones hacia datos globales (usuarios, vehículos, sedes) no llevan
+# restricción en la base de datos: las filas de una sede pueden estar en otra
+# base (alias) distinta de la de esas tablas.
 
 # 1) Modelo EspacioParqueadero
 class EspacioParqueadero(models.Model):
@@ -16,10 +52,21 @@ class EspacioParqueadero(models.Model):
         ('BLOQUEADO', 'BLOQUEADO'),
     ]
 
-    numero = models.IntegerField(unique=True)
+    parqueadero = models.ForeignKey(Parqueadero, on_delete=models.PROTECT, related_name='espacios', db_constraint=False)
+    numero = models.IntegerField()
     tipo = models.CharField(max_length=20, choices=TIPO_CHOICES)
     estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='LIBRE')
 
+    class Meta:
+        constraints = [
+            # También es el índice de las consultas por sede ordenadas por número
+            models.UniqueConstraint(fields=['parqueadero', 'numero'], name='espacio_numero_unico_por_parqueadero'),
+        ]
+
+    def save(self, *args, **kwargs):
+        _asignar_parqueadero(self)
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"Espacio {self.numero} - {self.tipo} - {self.estado}"
 
@@ -28,6 +75,7 @@ class Reserva(models.Model):
     TIPO_VEHICULO_CHOICES = [
         ('CARRO', 'CARRO'),
         ('MOTO', 'MOTO'),
+        ('DISCAPACIDAD', 'DISCAPACIDAD'),
     ]
     ESTADO_CHOICES = [
         ('RESERVADA', 'RESERVADA'),
@@ -36,13 +84,16 @@ class Reserva(models.Model):
         ('VENCIDA', 'VENCIDA'),
     ]
 
-    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='reservas')
+    # Copia de espacio.parqueadero para filtrar e indexar primero por sede
+    parqueadero = models.ForeignKey(Parqueadero, on_delete=models.PROTECT, related_name='reservas', db_constraint=False)
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='reservas', db_constraint=False)
     espacio = models.ForeignKey(EspacioParqueadero, on_delete=models.PROTECT, related_name='reservas')
     fecha = models.DateField()
     hora_inicio = models.TimeField()
     hora_fin = models.TimeField()
-    tipo_vehiculo = models.CharField(max_length=10, choices=TIPO_VEHICULO_CHOICES)
-    placa = models.CharField(max_length=20)
+    tipo_vehiculo = models.CharField(max_length=20, choices=TIPO_VEHICULO_CHOICES)
+    placa = models.CharField(max_length=20, db_index=True)  # normalizada, ver core.placas
+    vehiculo = models.ForeignKey('Vehiculo', on_delete=models.SET_NULL, null=True, blank=True, related_name='reservas', db_constraint=False)
     estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='RESERVADA')
     
     # Campos de auditoría operativa
@@ -53,6 +104,29 @@ class Reserva(models.Model):
     creado_en = models.DateTimeField(auto_now_add=True)
     actualizado_en = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Consultas por sede y día (disponibilidad, portería, salidas, asignación)
+            # y por espacio (solapamientos, estado)
+            models.Index(fields=['parqueadero', 'fecha', 'estado']),
+            models.Index(fields=['espacio', 'fecha']),
+            # Vehículos dentro (entraron y no han salido), de cualquier fecha:
+            # listado de salidas. Parcial, así que solo guarda esas filas.
+            models.Index(
+                fields=['parqueadero'],
+                condition=models.Q(estado='RESERVADA', hora_entrada__isnull=False, hora_salida__isnull=True),
+                name='reserva_entrada_abierta',
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.parqueadero_id is None and self.espacio_id is not None:
+            self.parqueadero_id = self.espacio.parqueadero_id
+        # La portería busca por igualdad exacta: se normaliza venga de donde venga
+        # (admin, shell...). bulk_create/update no pasan por aquí.
+        self.placa = normalizar_placa(self.placa)
+        super().save(*args, **kwargs)
+
     def clean(self):
         # Validación básica: hora_inicio debe ser menor que hora_fin
         if self.hora_inicio and self.hora_fin and self.hora_inicio >= self.hora_fin:
@@ -72,7 +146,11 @@ class Vehiculo(models.Model):
     placa = models.CharField(max_length=20, unique=True)
     tipo = models.CharField(max_length=10, choices=TIPO_CHOICES)
     descripcion = models.CharField(max_length=100, blank=True, null=True)
-    
+
+    def save(self, *args, **kwargs):
+        self.placa = normalizar_placa(self.placa)
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.placa} ({self.tipo})"
 
@@ -86,10 +164,87 @@ class Incidencia(models.Model):
     ]
 
     tipo = models.CharField(max_length=30, choices=TIPO_CHOICES)
+    parqueadero = models.ForeignKey(Parqueadero, on_delete=models.PROTECT, related_name='incidencias', db_constraint=False)
     espacio = models.ForeignKey(EspacioParqueadero, on_delete=models.SET_NULL, null=True, blank=True)
+    placa = models.CharField(max_length=20, blank=True, db_index=True)
     descripcion = models.TextField()
-    reportado_por = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True)
-    fecha_hora = models.DateTimeField(auto_now_add=True)
+    reportado_por = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, db_constraint=False)
+    fecha_hora = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    # Completados en segundo plano por core.incidencias
+    reserva = models.ForeignKey(Reserva, on_delete=models.SET_NULL, null=True, blank=True, related_name='incidencias')
+    procesada_en = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['parqueadero', 'fecha_hora']),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.parqueadero_id is None and self.espacio_id is not None:
+            self.parqueadero_id = self.espacio.parqueadero_id
+        _asignar_parqueadero(self)
+        self.placa = normalizar_placa(self.placa)
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Incidencia {self.tipo} - {self.fecha_hora}"
+
+# 5) Modelo CorreoSaliente (bandeja de salida)
+class CorreoSaliente(models.Model):
+    ESTADO_CHOICES = [
+        ('PENDIENTE', 'PENDIENTE'),
+        ('ENVIANDO', 'ENVIANDO'),
+        ('ENVIADO', 'ENVIADO'),
+        ('FALLIDO', 'FALLIDO'),
+    ]
+
+    asunto = models.CharField(max_length=255)
+    cuerpo = models.TextField()
+    cuerpo_html = models.TextField(blank=True)
+    remitente = models.CharField(max_length=255)
+    destinatarios = models.JSONField(default=list)
+    # cc, bcc, reply_to y headers del EmailMessage original
+    extra = models.JSONField(default=dict, blank=True)
+
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='PENDIENTE')
+    intentos = models.PositiveSmallIntegerField(default=0)
+    proximo_intento = models.DateTimeField(default=timezone.now)
+    ultimo_error = models.TextField(blank=True)
+    lote = models.CharField(max_length=32, blank=True)
+
+    creado_en = models.DateTimeField(auto_now_add=True)
+    enviado_en = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['estado', 'proximo_intento']),
+        ]
+
+    def __str__(self):
+        return f"Correo {self.id} - {self.asunto} ({self.estado})"
+
+# 6) Modelo EventoPorteria (eventos del diario de portería ya aplicados)
+class EventoPorteria(models.Model):
+    TIPO_CHOICES = [
+        ('ENTRADA', 'ENTRADA'),
+        ('SALIDA', 'SALIDA'),
+    ]
+    RESULTADO_CHOICES = [
+        ('APLICADO', 'APLICADO'),
+        ('CONFLICTO', 'CONFLICTO'),
+    ]
+
+    # Identificador asignado en la portería: evita aplicar dos veces el mismo evento
+    uuid = models.UUIDField(unique=True)
+    tipo = models.CharField(max_length=10, choices=TIPO_CHOICES)
+    parqueadero = models.ForeignKey(Parqueadero, on_delete=models.PROTECT, related_name='eventos_porteria', db_constraint=False)
+    reserva = models.ForeignKey(Reserva, on_delete=models.SET_NULL, null=True, blank=True, related_name='eventos_porteria')
+    vigilante = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, db_constraint=False)
+    ocurrido_en = models.DateTimeField()
+    aplicado_en = models.DateTimeField(auto_now_add=True)
+    resultado = models.CharField(max_length=10, choices=RESULTADO_CHOICES)
+    detalle = models.CharField(max_length=255, blank=True)
+
+    def __str__(self):
+        return f"{self.tipo} {self.uuid} ({self.resultado})"
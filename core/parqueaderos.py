@@ -0,0 +1,169 @@
+"""
+Varias sedes (parqueaderos) en una sola instalación.
+
+Cada petición trabaja sobre una sede, la "sede actual", guardada en una
+``ContextVar``:
+- ``ParqueaderoMiddleware`` la resuelve (elegida en la sesión, la primera
+  sede del vigilante o la principal) y la deja en ``request.parqueadero``.
+- Las vistas filtran por ella las consultas frecuentes (disponibilidad,
+  portería, salidas, solapamientos).
+- ``EnrutadorParqueaderos`` envía los espacios, reservas e incidencias a la
+  base de datos de la sede (``Parqueadero.base_datos``). Con todas las
+  sedes en ``default`` no cambia nada; una sede con mucho tráfico puede
+  moverse a su propio alias de ``DATABASES``.
+
+Fuera de una petición (comandos, colas) se usa ``usar_parqueadero``. El
+admin no tiene sede actual y trabaja sobre ``default``.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+_parqueadero_actual = ContextVar('parqueadero_actual', default=None)
+
+# Modelos de core cuyas filas pertenecen a una sede
+MODELOS_POR_SEDE = {'espacioparqueadero', 'reserva', 'incidencia', 'eventoporteria'}
+
+
+def parqueadero_actual():
+    return _parqueadero_actual.get()
+
+
+def base_datos_actual():
+    parqueadero = _parqueadero_actual.get()
+    return parqueadero.base_datos if parqueadero is not None else DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def usar_parqueadero(parqueadero):
+    token = _parqueadero_actual.set(parqueadero)
+    try:
+        yield parqueadero
+    finally:
+        _parqueadero_actual.reset(token)
+
+
+# --- Caché de sedes ---
+# Hay pocas sedes y casi no cambian: se leen una vez y se releen al vencer
+# SEDES_CACHE_TTL. core.signals vacía la caché del proceso que guarda o
+# elimina una sede; los demás procesos (otros workers, comandos en
+# --continuo) se ponen al día al vencer el TTL.
+
+_sedes = None
+_sedes_vencen = 0.0
+_lock_sedes = threading.Lock()
+
+
+def sedes():
+    """Dict ``id -> Parqueadero`` con todas las sedes."""
+    global _sedes, _sedes_vencen
+    actuales = _sedes
+    if actuales is None or time.monotonic() >= _sedes_vencen:
+        from .models import Parqueadero
+
+        with _lock_sedes:
+            if _sedes is None or time.monotonic() >= _sedes_vencen:
+                _sedes = {parqueadero.id: parqueadero for parqueadero in Parqueadero.objects.using(DEFAULT_DB_ALIAS)}
+                _sedes_vencen = time.monotonic() + getattr(settings, 'SEDES_CACHE_TTL', 30)
+            actuales = _sedes
+    return actuales
+
+
+def invalidar_sedes():
+    global _sedes
+    with _lock_sedes:
+        _sedes = None
+
+
+def parqueaderos_permitidos(user):
+    """
+    Sedes que puede usar el usuario: un vigilante solo las que tiene
+    asignadas (si no tiene ninguna, solo la principal); un cliente o un
+    superusuario, todas.
+    """
+    todas = sedes()
+    asignadas = list(user.parqueaderos_vigilados.values_list('id', flat=True))
+    if asignadas:
+        return [todas[pk] for pk in asignadas if pk in todas]
+    if not user.is_superuser and user.groups.filter(name='VIGILANTE').exists():
+        from .models import Parqueadero
+
+        return [Parqueadero.principal()]
+    return list(todas.values())
+
+
+def resolver_parqueadero(request):
+    todas = sedes()
+    elegida = todas.get(request.session.get('parqueadero_id'))
+    if elegida is not None:
+        return elegida
+    if not todas:
+        from .models import Parqueadero
+
+        invalidar_sedes()
+        return Parqueadero.principal()
+    permitidas = parqueaderos_permitidos(request.user)
+    elegida = permitidas[0] if permitidas else next(iter(todas.values()))
+    request.session['parqueadero_id'] = elegida.id
+    return elegida
+
+
+class ParqueaderoMiddleware:
+    """Fija la sede actual de cada petición autenticada (va después de AuthenticationMiddleware)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.parqueadero = None
+        if not request.user.is_authenticated:
+            return self.get_response(request)
+        request.parqueadero = resolver_parqueadero(request)
+        with usar_parqueadero(request.parqueadero):
+            return self.get_response(request)
+
+
+def contexto(request):
+    """Procesador de contexto: sede actual y sedes para el selector del menú."""
+    parqueadero = getattr(request, 'parqueadero', None)
+    if parqueadero is None:
+        return {}
+    return {
+        'parqueadero_actual': parqueadero,
+        'parqueaderos': parqueaderos_permitidos(request.user) if len(sedes()) > 1 else [],
+    }
+
+
+class EnrutadorParqueaderos:
+    """
+    Router de base de datos (``DATABASE_ROUTERS``):
+    - Espacios, reservas, incidencias y eventos de portería: la base de la
+      instancia relacionada o, si no hay, la de la sede actual.
+    - El resto (usuarios, vehículos, sedes, correo): siempre ``default``.
+
+    Las migraciones se aplican completas en todos los alias.
+    """
+
+    def _base(self, model, **hints):
+        if model._meta.app_label == 'core' and model._meta.model_name in MODELOS_POR_SEDE:
+            instancia = hints.get('instance')
+            if instancia is not None and instancia._state.db and self._por_sede(instancia):
+                return instancia._state.db
+            return base_datos_actual()
+        return DEFAULT_DB_ALIAS
+
+    db_for_read = _base
+    db_for_write = _base
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if not (self._por_sede(obj1) and self._por_sede(obj2)):
+            return True
+        return obj1._state.db == obj2._state.db
+
+    @staticmethod
+    def _por_sede(obj):
+        return obj._meta.app_label == 'core' and obj._meta.model_name in MODELOS_POR_SEDE
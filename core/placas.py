@@ -0,0 +1,107 @@
+"""
+Caché en memoria placa -> vehículo registrado.
+
+La portería y el formulario de reserva consultan la misma placa muchas veces;
+este LRU con TTL evita repetir la búsqueda en ``Vehiculo``. También guarda
+los resultados negativos (placa no registrada). Las señales de ``Vehiculo``
+invalidan las entradas al agregar, modificar o eliminar un vehículo; en
+despliegues con varios procesos los demás procesos se ponen al día al vencer
+el TTL (``CACHE_PLACAS_TTL``).
+"""
+import re
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+
+from .metricas import registro
+
+VehiculoRegistrado = namedtuple('VehiculoRegistrado', ['vehiculo_id', 'usuario_id', 'tipo', 'placa'])
+
+_RE_SEPARADORES = re.compile(r'[\s\-.]+')
+
+
+def normalizar_placa(placa):
+    """'abc-123 ' -> 'ABC123'"""
+    return _RE_SEPARADORES.sub('', placa or '').upper()
+
+
+class CachePlacas:
+    """LRU con vencimiento por entrada, seguro entre hilos."""
+
+    def __init__(self, maximo=1024, ttl=300):
+        self.maximo = maximo
+        self.ttl = ttl
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def obtener(self, placa, cargar):
+        """
+        Devuelve el valor cacheado para ``placa`` o lo calcula con ``cargar(placa)``.
+        ``placa`` debe venir normalizada.
+        """
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._datos.get(placa)
+            if entrada is not None and entrada[1] > ahora:
+                self._datos.move_to_end(placa)
+                self.aciertos += 1
+                self._publicar('hit')
+                return entrada[0]
+            self.fallos += 1
+            self._publicar('miss')
+
+        valor = cargar(placa)
+        with self._lock:
+            self._datos[placa] = (valor, ahora + self.ttl)
+            self._datos.move_to_end(placa)
+            while len(self._datos) > self.maximo:
+                self._datos.popitem(last=False)
+        return valor
+
+    def invalidar(self, placa=None, vehiculo_id=None):
+        """Elimina la entrada de la placa y cualquier otra que apunte al vehículo."""
+        with self._lock:
+            self._datos.pop(placa, None)
+            if vehiculo_id is not None:
+                for clave in [c for c, (v, _) in self._datos.items() if v and v.vehiculo_id == vehiculo_id]:
+                    del self._datos[clave]
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+
+    @property
+    def tasa_aciertos(self):
+        total = self.aciertos + self.fallos
+        return self.aciertos / total if total else 0.0
+
+    def _publicar(self, resultado):
+        registro.incrementar('miparqueo_plate_cache_lookups_total', ayuda='Búsquedas en la caché de placas.',
+                             resultado=resultado)
+        registro.fijar('miparqueo_plate_cache_hit_ratio', round(self.tasa_aciertos, 4),
+                       ayuda='Proporción de aciertos de la caché de placas.')
+
+
+cache_placas = CachePlacas(
+    maximo=getattr(settings, 'CACHE_PLACAS_MAXIMO', 1024),
+    ttl=getattr(settings, 'CACHE_PLACAS_TTL', 300),
+)
+
+
+def _cargar_vehiculo(placa):
+    from .models import Vehiculo
+
+    fila = Vehiculo.objects.filter(placa=placa).values_list('id', 'usuario_id', 'tipo', 'placa').first()
+    return VehiculoRegistrado(*fila) if fila else None
+
+
+def buscar_vehiculo(placa):
+    """Devuelve un ``VehiculoRegistrado`` para la placa o None si no está registrada."""
+    placa = normalizar_placa(placa)
+    if not placa:
+        return None
+    return cache_placas.obtener(placa, _cargar_vehiculo)
@@ -0,0 +1,405 @@
+"""
+Modo de portería con diario local (``PORTERIA_MODO_DIARIO = True``).
+
+Registrar una entrada o salida no escribe en la base de datos: el evento se
+agrega a un archivo local de solo anexado (una línea JSON por evento) y se
+hace ``fsync`` antes de responder, así la barrera no espera a la base de
+datos aunque esté lenta o bloqueada. Un sincronizador en segundo plano
+(``cola_porteria``) aplica después los eventos a ``Reserva`` (y, por las
+señales, a ``EspacioParqueadero``):
+
+- Lee el diario desde la posición guardada en ``eventos.pos``.
+- Aplica cada lote en una transacción por sede y registra cada evento en
+  ``EventoPorteria`` (``uuid`` único). Si el proceso muere antes del commit
+  no queda nada aplicado; si muere después, al releer el lote los uuid ya
+  registrados se saltan. Ningún evento se pierde ni se aplica dos veces.
+- Solo después del commit avanza ``eventos.pos`` (escritura atómica).
+
+La cola sincroniza al escribir cada evento y, desde entonces, cada
+``PORTERIA_INTERVALO_SINCRONIZACION`` segundos, así lo que no se pudo aplicar
+(base caída) se reintenta aunque no lleguen más vehículos. Sin tráfico tras
+reiniciar el proceso, ``manage.py reproducir_porteria --continuo`` hace de
+trabajador dedicado. Mientras tanto las vistas de portería superponen los
+eventos pendientes (``superponer_pendientes``) para que el vigilante vea sus
+propios registros.
+
+Los eventos que ya no se pueden aplicar (reserva cancelada, salida ya
+registrada...) quedan como CONFLICTO con el motivo, para revisarlos en el
+admin. ``manage.py reproducir_porteria`` sincroniza a mano, reaplica el
+diario completo o carga el diario copiado de otra portería.
+"""
+import json
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime
+
+from django.conf import settings
+from django.db import router, transaction
+from django.utils import timezone
+
+from .metricas import registro
+from .models import EventoPorteria, Reserva
+from .parqueaderos import invalidar_sedes, sedes, usar_parqueadero
+from .tareas import ColaTrabajos
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos, la unicidad del uuid evita duplicados
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_lock_escritura = threading.Lock()
+_lock_sincronizacion = threading.Lock()
+
+
+def modo_diario():
+    return getattr(settings, 'PORTERIA_MODO_DIARIO', False)
+
+
+def _directorio():
+    directorio = getattr(settings, 'PORTERIA_DIARIO_DIR', None) or os.path.join(settings.BASE_DIR, 'diario_porteria')
+    os.makedirs(directorio, exist_ok=True)
+    return directorio
+
+
+def ruta_diario():
+    return os.path.join(_directorio(), 'eventos.jsonl')
+
+
+def _ruta_posicion():
+    return os.path.join(_directorio(), 'eventos.pos')
+
+
+def _bloquear(descriptor):
+    if fcntl is not None:
+        fcntl.flock(descriptor, fcntl.LOCK_EX)
+
+
+def _desbloquear(descriptor):
+    if fcntl is not None:
+        fcntl.flock(descriptor, fcntl.LOCK_UN)
+
+
+# --- Escritura (portería) ---
+
+def registrar_evento(tipo, reserva, vigilante=None):
+    """
+    Agrega un evento ENTRADA o SALIDA al diario y espera a que esté en disco.
+    Devuelve el evento (dict). La sincronización queda encolada.
+    """
+    evento = {
+        'uuid': str(uuid.uuid4()),
+        'tipo': tipo,
+        'reserva_id': reserva.id,
+        'parqueadero_id': reserva.parqueadero_id,
+        'vigilante_id': vigilante.id if vigilante is not None else None,
+        'ocurrido_en': timezone.now().isoformat(),
+    }
+    linea = (json.dumps(evento) + '\n').encode()
+    with _lock_escritura:
+        descriptor = os.open(ruta_diario(), os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o640)
+        try:
+            _bloquear(descriptor)
+            # Si un proceso murió a mitad de una línea, se cierra antes de escribir
+            tamano = os.fstat(descriptor).st_size
+            if tamano and os.pread(descriptor, 1, tamano - 1) != b'\n':
+                linea = b'\n' + linea
+            os.write(descriptor, linea)
+            os.fsync(descriptor)
+        finally:
+            os.close(descriptor)
+    registro.incrementar('miparqueo_gate_journal_events_total', ayuda='Eventos escritos en el diario de portería.',
+                         tipo=tipo)
+    cola_porteria.encolar('sincronizar')
+    return evento
+
+
+# --- Lectura ---
+
+def leer_eventos(ruta, desde=0):
+    """
+    Genera ``(posicion_siguiente, evento)`` desde el byte ``desde``. Una
+    última línea sin terminar (escritura en curso) no se lee; una línea
+    corrupta se registra en el log y se salta.
+    """
+    with open(ruta, 'rb') as archivo:
+        archivo.seek(desde)
+        posicion = desde
+        for linea in archivo:
+            if not linea.endswith(b'\n'):
+                return
+            posicion += len(linea)
+            if not linea.strip():
+                continue
+            try:
+                yield posicion, json.loads(linea)
+            except ValueError:
+                logger.error('Línea inválida en el diario de portería (byte %d): %r', posicion - len(linea), linea[:200])
+
+
+def leer_posicion():
+    try:
+        with open(_ruta_posicion()) as archivo:
+            return int(archivo.read().strip() or 0)
+    except FileNotFoundError:
+        return 0
+
+
+def guardar_posicion(posicion):
+    temporal = _ruta_posicion() + '.tmp'
+    with open(temporal, 'w') as archivo:
+        archivo.write(str(posicion))
+        archivo.flush()
+        os.fsync(archivo.fileno())
+    os.replace(temporal, _ruta_posicion())
+
+
+def pendientes():
+    """Eventos del diario que aún no se han sincronizado."""
+    if not os.path.exists(ruta_diario()):
+        return []
+    return [evento for _, evento in leer_eventos(ruta_diario(), leer_posicion())]
+
+
+def pendientes_de(parqueadero):
+    """
+    Eventos pendientes de una sede, en orden. Si hay alguno también se
+    encola una sincronización (p. ej. quedaron de antes de reiniciar).
+    """
+    eventos = [evento for evento in pendientes() if evento['parqueadero_id'] == parqueadero.id]
+    if eventos:
+        cola_porteria.encolar('sincronizar')
+    return eventos
+
+
+def superponer_pendientes(reservas, eventos):
+    """
+    Aplica en memoria, sin guardar, los ``eventos`` pendientes sobre
+    ``reservas`` (dict id -> Reserva) con las mismas reglas que la
+    sincronización. Las reservas modificadas quedan marcadas con
+    ``pendiente_sincronizar``.
+    """
+    for evento in eventos:
+        reserva = reservas.get(evento['reserva_id'])
+        if reserva is not None and _aplicar(evento, reserva)[2]:
+            reserva.pendiente_sincronizar = True
+    return reservas
+
+
+def en_curso_con_pendientes(reservas, parqueadero):
+    """
+    Vehículos dentro según la base (``reservas``) más las entradas y
+    salidas del diario aún sin sincronizar.
+    """
+    eventos = pendientes_de(parqueadero)
+    if not eventos:
+        return reservas
+    por_id = {reserva.id: reserva for reserva in reservas}
+    faltan = {evento['reserva_id'] for evento in eventos} - por_id.keys()
+    por_id.update(Reserva.objects.filter(parqueadero=parqueadero).select_related('espacio').in_bulk(faltan))
+    superponer_pendientes(por_id, eventos)
+    en_curso = [
+        reserva for reserva in por_id.values()
+        if reserva.estado == 'RESERVADA' and reserva.hora_entrada is not None and reserva.hora_salida is None
+    ]
+    return sorted(en_curso, key=lambda reserva: (reserva.fecha, reserva.hora_entrada))
+
+
+# --- Aplicación ---
+
+def _aplicar(evento, reserva):
+    """
+    Aplica un evento sobre la reserva (en memoria). Devuelve
+    ``(resultado, detalle, campos_modificados)``.
+    """
+    if reserva is None:
+        return 'CONFLICTO', f"La reserva {evento['reserva_id']} no existe en la sede.", []
+    hora = datetime.fromisoformat(evento['ocurrido_en']).time()
+
+    if evento['tipo'] == 'ENTRADA':
+        if reserva.estado != 'RESERVADA':
+            return 'CONFLICTO', f'La reserva está {reserva.estado}.', []
+        if reserva.hora_entrada is not None:
+            return 'CONFLICTO', f'La entrada ya estaba registrada ({reserva.hora_entrada:%H:%M}).', []
+        reserva.hora_entrada = hora
+        return 'APLICADO', '', ['hora_entrada']
+
+    if reserva.estado == 'COMPLETADA' and reserva.hora_salida is not None:
+        return 'CONFLICTO', f'La salida ya estaba registrada ({reserva.hora_salida:%H:%M}).', []
+    if reserva.estado != 'RESERVADA':
+        return 'CONFLICTO', f'La reserva está {reserva.estado}.', []
+    reserva.hora_salida = hora
+    reserva.estado = 'COMPLETADA'
+    detalle = '' if reserva.hora_entrada is not None else 'Salida sin entrada registrada.'
+    return 'APLICADO', detalle, ['hora_salida', 'estado']
+
+
+def aplicar_eventos(eventos, parqueadero):
+    """
+    Aplica en una sola transacción los eventos de una sede. Los uuid ya
+    registrados se saltan. Devuelve un dict con el conteo por resultado.
+    """
+    conteo = {'APLICADO': 0, 'CONFLICTO': 0, 'REPETIDO': 0}
+    with usar_parqueadero(parqueadero), transaction.atomic(using=router.db_for_write(EventoPorteria)):
+        ya_aplicados = set(
+            str(valor) for valor in EventoPorteria.objects.filter(
+                uuid__in=[evento['uuid'] for evento in eventos],
+            ).values_list('uuid', flat=True)
+        )
+        nuevos = [evento for evento in eventos if evento['uuid'] not in ya_aplicados]
+        conteo['REPETIDO'] = len(eventos) - len(nuevos)
+        reservas = Reserva.objects.filter(parqueadero=parqueadero).in_bulk({evento['reserva_id'] for evento in nuevos})
+
+        registros = []
+        modificados = {}
+        for evento in nuevos:
+            reserva = reservas.get(evento['reserva_id'])
+            resultado, detalle, campos = _aplicar(evento, reserva)
+            if campos:
+                modificados.setdefault(reserva.id, (reserva, set()))[1].update(campos)
+            conteo[resultado] += 1
+            registros.append(EventoPorteria(
+                uuid=evento['uuid'],
+                tipo=evento['tipo'],
+                parqueadero=parqueadero,
+                reserva=reserva,
+                vigilante_id=evento.get('vigilante_id'),
+                ocurrido_en=datetime.fromisoformat(evento['ocurrido_en']),
+                resultado=resultado,
+                detalle=detalle,
+            ))
+
+        # save() y no update(): las señales recalculan el estado del espacio
+        for reserva, campos in modificados.values():
+            reserva.save(update_fields=[*campos, 'actualizado_en'])
+        EventoPorteria.objects.bulk_create(registros)
+    return conteo
+
+
+def sincronizar(ruta=None, desde=None, tamano_lote=None):
+    """
+    Aplica los eventos del diario desde la última posición sincronizada
+    (o desde el byte ``desde``), en lotes. Con ``ruta`` se lee otro archivo
+    (p. ej. el diario copiado de otra portería) sin tocar ``eventos.pos``.
+    Devuelve el conteo total por resultado.
+    """
+    tamano_lote = tamano_lote or getattr(settings, 'PORTERIA_TAMANO_LOTE', 200)
+    total = {'APLICADO': 0, 'CONFLICTO': 0, 'REPETIDO': 0}
+    if ruta is not None:
+        lote = []
+        for _, evento in leer_eventos(ruta, desde or 0):
+            lote.append(evento)
+            if len(lote) >= tamano_lote:
+                if not _aplicar_lote(lote, total):
+                    break
+                lote = []
+        else:
+            if lote:
+                _aplicar_lote(lote, total)
+        return _reportar(total)
+
+    if not os.path.exists(ruta_diario()):
+        return total
+    # Un solo sincronizador a la vez, también entre procesos. Es otro archivo
+    # distinto del diario para no frenar a la portería mientras se sincroniza.
+    with _lock_sincronizacion, open(os.path.join(_directorio(), 'eventos.lock'), 'w') as candado:
+        _bloquear(candado.fileno())
+        try:
+            posicion = leer_posicion() if desde is None else desde
+            if posicion > os.path.getsize(ruta_diario()):
+                logger.warning('Diario de portería más corto que la posición guardada; se relee desde el inicio')
+                posicion = 0
+            lote = []
+            for siguiente, evento in leer_eventos(ruta_diario(), posicion):
+                lote.append(evento)
+                posicion = siguiente
+                if len(lote) >= tamano_lote:
+                    if not _aplicar_lote(lote, total):
+                        # La posición queda antes de este lote y el diario no
+                        # se compacta: sus eventos se reintentan en la próxima pasada
+                        break
+                    lote = []
+                    guardar_posicion(posicion)
+            else:
+                if not lote or _aplicar_lote(lote, total):
+                    guardar_posicion(posicion)
+                    _compactar(posicion)
+        finally:
+            _desbloquear(candado.fileno())
+    return _reportar(total)
+
+
+def _compactar(posicion):
+    """
+    Vacía el diario si todo está sincronizado. La posición se pone en 0
+    antes de truncar: si el proceso muere en medio, se relee el diario y
+    los eventos se saltan por su uuid.
+    """
+    descriptor = os.open(ruta_diario(), os.O_WRONLY)
+    try:
+        _bloquear(descriptor)  # el mismo bloqueo que usan las porterías al escribir
+        if os.fstat(descriptor).st_size != posicion:
+            return
+        guardar_posicion(0)
+        os.ftruncate(descriptor, 0)
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+
+def _reportar(total):
+    for resultado, cantidad in total.items():
+        if cantidad:
+            registro.incrementar('miparqueo_gate_events_synced_total', cantidad,
+                                 ayuda='Eventos del diario de portería sincronizados por resultado.',
+                                 resultado=resultado)
+    if total['CONFLICTO']:
+        logger.warning('Diario de portería: %d evento(s) en conflicto, revisar en el admin', total['CONFLICTO'])
+    return total
+
+
+def _aplicar_lote(lote, total):
+    """
+    Aplica un lote agrupado por sede. Devuelve False si algún evento es de
+    una sede que no existe ni releyendo la caché de sedes (p. ej. creada en
+    otro proceso): esos eventos no se aplican y la sincronización debe
+    detenerse para no darlos por leídos.
+    """
+    por_sede = {}
+    for evento in lote:
+        por_sede.setdefault(evento['parqueadero_id'], []).append(evento)
+    todas = sedes()
+    if any(parqueadero_id not in todas for parqueadero_id in por_sede):
+        invalidar_sedes()
+        todas = sedes()
+    completo = True
+    for parqueadero_id, eventos in por_sede.items():
+        parqueadero = todas.get(parqueadero_id)
+        if parqueadero is None:
+            logger.error('Diario de portería: sede %s desconocida, %d evento(s) quedan pendientes: %s',
+                         parqueadero_id, len(eventos), [evento['uuid'] for evento in eventos])
+            completo = False
+            continue
+        for resultado, cantidad in aplicar_eventos(eventos, parqueadero).items():
+            total[resultado] += cantidad
+    return completo
+
+
+def _sincronizar_lote(elementos):
+    # Todos los elementos piden lo mismo: una pasada sobre el diario
+    sincronizar()
+    return []
+
+
+cola_porteria = ColaTrabajos(
+    'porteria',
+    _sincronizar_lote,
+    tamano_lote=100,
+    espera_lote=0.2,
+    reintentos=5,
+    periodo=getattr(settings, 'PORTERIA_INTERVALO_SINCRONIZACION', 10),
+    elemento_periodico='sincronizar',
+)
@@ -0,0 +1,200 @@
+"""
+Pronóstico de capacidad a partir del historial de reservas.
+
+Carga las reservas en arreglos de NumPy por bloques y calcula, con
+operaciones vectorizadas, para cada tipo de espacio (CARRO, MOTO,
+DISCAPACIDAD), día de la semana y franja de 15 minutos:
+- La curva de demanda (espacios ocupados en promedio).
+- El pico (percentil configurable) ajustado por la tasa de inasistencia.
+
+Lo usan el comando ``pronosticar_demanda`` y la página de pronóstico del
+admin de reservas. NumPy es una dependencia opcional: solo se importa aquí.
+"""
+import datetime
+from itertools import islice
+
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import EspacioParqueadero, Reserva
+
+TIPOS = [tipo for tipo, _ in EspacioParqueadero.TIPO_CHOICES]
+MINUTOS_FRANJA = 15
+FRANJAS_DIA = 24 * 60 // MINUTOS_FRANJA
+# Historial máximo: los arreglos crecen con los días (3 x días x franjas)
+SEMANAS_MAXIMAS = 520
+DIAS_SEMANA = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
+
+
+class NumpyNoDisponible(ImportError):
+    pass
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError as error:
+        raise NumpyNoDisponible('El pronóstico de capacidad requiere NumPy (pip install numpy).') from error
+    return numpy
+
+
+def _minutos(hora):
+    return hora.hour * 60 + hora.minute
+
+
+def cargar_historial(desde, hasta, tamano_bloque=50000):
+    """
+    Lee las reservas (no canceladas) entre ``desde`` y ``hasta`` y devuelve
+    un dict de arreglos columnares: ``tipo`` (índice en TIPOS), ``dia``
+    (días desde ``desde``), ``inicio`` y ``fin`` (franjas), ``total``
+    (reservas con esos mismos datos) y ``asistidas`` (con registro de entrada).
+
+    La base de datos agrupa las reservas idénticas (mismo tipo, fecha y
+    horario), así que se transfieren y convierten muchas menos filas; los
+    grupos se leen en bloques de ``tamano_bloque``.
+    """
+    np = _numpy()
+    indice_tipo = {tipo: i for i, tipo in enumerate(TIPOS)}
+    origen = np.datetime64(desde, 'D')
+    filas = (
+        Reserva.objects
+        .filter(fecha__gte=desde, fecha__lte=hasta)
+        .exclude(estado='CANCELADA')
+        .values_list('espacio__tipo', 'fecha', 'hora_inicio', 'hora_fin')
+        .annotate(total=Count('id'), asistidas=Count('id', filter=Q(hora_entrada__isnull=False)))
+        .order_by()
+        .iterator(chunk_size=tamano_bloque)
+    )
+
+    bloques = []
+    while True:
+        bloque = list(islice(filas, tamano_bloque))
+        if not bloque:
+            break
+        tipos, fechas, inicios, fines, totales, asistidas = zip(*bloque)
+        minutos_fin = np.array([_minutos(h) for h in fines], dtype=np.int16)
+        bloques.append((
+            np.array([indice_tipo[t] for t in tipos], dtype=np.int8),
+            (np.array(fechas, dtype='datetime64[D]') - origen).astype(np.int32),
+            np.array([_minutos(h) for h in inicios], dtype=np.int16) // MINUTOS_FRANJA,
+            # Una reserva hasta las 10:05 ocupa también la franja de las 10:00
+            -(-minutos_fin // MINUTOS_FRANJA),
+            np.array(totales, dtype=np.int32),
+            np.array(asistidas, dtype=np.int32),
+        ))
+
+    nombres = ('tipo', 'dia', 'inicio', 'fin', 'total', 'asistidas')
+    if not bloques:
+        tipos_vacios = (np.int8, np.int32, np.int16, np.int16, np.int32, np.int32)
+        return {nombre: np.zeros(0, dtype=tipo) for nombre, tipo in zip(nombres, tipos_vacios)}
+    return {nombre: np.concatenate(columna) for nombre, columna in zip(nombres, zip(*bloques))}
+
+
+def _ocupacion(np, historial, dias, pesos):
+    """
+    Matriz (tipo, día, franja) con los espacios ocupados, usando un arreglo
+    de diferencias: +peso en la franja de inicio, -peso en la de fin y suma
+    acumulada a lo largo del día.
+    """
+    validas = historial['fin'] > historial['inicio']
+    tipo, dia = historial['tipo'][validas], historial['dia'][validas]
+    inicio, fin, pesos = historial['inicio'][validas], historial['fin'][validas], pesos[validas]
+
+    diferencias = np.zeros((len(TIPOS), dias, FRANJAS_DIA + 1), dtype=np.int32)
+    np.add.at(diferencias, (tipo, dia, inicio), pesos)
+    np.add.at(diferencias, (tipo, dia, fin), -pesos)
+    return np.cumsum(diferencias, axis=2)[:, :, :FRANJAS_DIA]
+
+
+def calcular_pronostico(semanas=52, percentil=90, hoy=None, tamano_bloque=50000):
+    """
+    Calcula el pronóstico con las últimas ``semanas`` de historial.
+
+    Devuelve un dict con arreglos (tipo, día de la semana, franja):
+    ``demanda`` (promedio), ``pico`` (percentil ajustado por inasistencia),
+    ``inasistencia`` (tasa 0-1) y, por hora, ``necesarios`` (espacios a
+    prever, entero), además de ``dias_historial``.
+    """
+    np = _numpy()
+    hoy = hoy or timezone.localdate()
+    hasta = hoy - datetime.timedelta(days=1)
+    desde = hoy - datetime.timedelta(weeks=semanas)
+    dias = (hasta - desde).days + 1
+
+    historial = cargar_historial(desde, hasta, tamano_bloque=tamano_bloque)
+    ocupacion = _ocupacion(np, historial, dias, historial['total'])
+    asistencia = _ocupacion(np, historial, dias, historial['asistidas'])
+
+    dia_semana = (desde.toordinal() + np.arange(dias) + 6) % 7  # date.weekday() vectorizado
+
+    forma = (len(TIPOS), 7, FRANJAS_DIA)
+    demanda = np.zeros(forma)
+    pico = np.zeros(forma)
+    reservado = np.zeros(forma)
+    asistido = np.zeros(forma)
+    for dia in range(7):
+        seleccion = dia_semana == dia
+        if not seleccion.any():
+            continue
+        demanda[:, dia] = ocupacion[:, seleccion].mean(axis=1)
+        pico[:, dia] = np.percentile(ocupacion[:, seleccion], percentil, axis=1)
+        reservado[:, dia] = ocupacion[:, seleccion].sum(axis=1)
+        asistido[:, dia] = asistencia[:, seleccion].sum(axis=1)
+
+    # Tasa de inasistencia por franja; donde no hay datos se usa la del tipo
+    total_tipo = reservado.sum(axis=(1, 2))
+    tasa_tipo = np.where(total_tipo > 0, 1 - asistido.sum(axis=(1, 2)) / np.maximum(total_tipo, 1), 0.0)
+    inasistencia = np.where(
+        reservado > 0,
+        1 - asistido / np.maximum(reservado, 1),
+        tasa_tipo[:, None, None],
+    )
+
+    pico_ajustado = pico * (1 - inasistencia)
+    por_hora = pico_ajustado.reshape(len(TIPOS), 7, 24, 60 // MINUTOS_FRANJA).max(axis=3)
+    return {
+        'demanda': demanda,
+        'pico': pico_ajustado,
+        'inasistencia': inasistencia,
+        'necesarios': np.ceil(por_hora - 1e-9).astype(int),
+        'dias_historial': dias,
+        'reservas': int(historial['total'].sum()),
+        'percentil': percentil,
+    }
+
+
+def proxima_semana(pronostico, hoy=None):
+    """
+    Tabla para los próximos 7 días: lista de (fecha, [(hora, {tipo: espacios})])
+    con solo las horas en las que algún tipo necesita espacios.
+    """
+    hoy = hoy or timezone.localdate()
+    necesarios = pronostico['necesarios']
+    semana = []
+    for desplazamiento in range(1, 8):
+        fecha = hoy + datetime.timedelta(days=desplazamiento)
+        horas = []
+        for hora in range(24):
+            valores = {tipo: int(necesarios[i, fecha.weekday(), hora]) for i, tipo in enumerate(TIPOS)}
+            if any(valores.values()):
+                horas.append((hora, valores))
+        semana.append((fecha, horas))
+    return semana
+
+
+def capacidad_actual():
+    """Número de espacios existentes por tipo, para comparar con el pronóstico."""
+    conteo = dict.fromkeys(TIPOS, 0)
+    for fila in EspacioParqueadero.objects.values('tipo').annotate(total=Count('id')):
+        conteo[fila['tipo']] = fila['total']
+    return conteo
+
+
+def maximo_por_tipo(semana):
+    maximos = dict.fromkeys(TIPOS, 0)
+    for _, horas in semana:
+        for _, valores in horas:
+            for tipo, valor in valores.items():
+                maximos[tipo] = max(maximos[tipo], valor)
+    return maximos
+
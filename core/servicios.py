@@ -0,0 +1,140 @@
+"""
+Servicio de transiciones de estado de los espacios.
+
+``EspacioParqueadero.estado`` es un dato desnormalizado: se deriva de las
+reservas del espacio y este módulo es el único que lo escribe. Las vistas
+solo modifican la ``Reserva``; las señales de ``core.signals`` llaman a
+``recalcular_estado_espacio`` y, si el estado cambia, se emite
+``estado_espacio_cambiado`` tras el commit.
+
+Las operaciones masivas (``QuerySet.update``, ``bulk_create``) no disparan
+señales: después de usarlas hay que llamar a ``recalcular_estados``.
+
+El estado RESERVADO depende además de la fecha: un espacio cuya última
+reserva era de ayer (inasistencia) no se guarda de nuevo al cambiar el día.
+``CambioDeDiaMiddleware`` encola ``recalcular_vencidos`` en la primera
+petición de cada día y ``cola_estados`` lo repite cada
+``ESTADOS_INTERVALO_RECALCULO`` segundos.
+"""
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import Count, Exists, OuterRef, Q
+from django.utils import timezone
+
+from .models import EspacioParqueadero, Reserva
+from .parqueaderos import sedes, usar_parqueadero
+from .signals import estado_espacio_cambiado
+from .tareas import ColaTrabajos
+
+
+def estado_derivado(espacio_id):
+    """
+    Calcula el estado que corresponde al espacio según sus reservas vigentes:
+    - OCUPADO si hay un vehículo que entró y no ha salido, sea cual sea la
+      fecha de la reserva (un carro que entró ayer sigue ahí).
+    - RESERVADO si hay alguna reserva RESERVADA de hoy en adelante.
+    - LIBRE en otro caso.
+    """
+    entrada_abierta = Q(hora_entrada__isnull=False, hora_salida__isnull=True)
+    vigente = Q(fecha__gte=timezone.localdate())
+    conteos = Reserva.objects.filter(
+        espacio_id=espacio_id,
+        estado='RESERVADA',
+    ).filter(vigente | entrada_abierta).aggregate(
+        vigentes=Count('id', filter=vigente),
+        ocupadas=Count('id', filter=entrada_abierta),
+    )
+    if conteos['ocupadas']:
+        return 'OCUPADO'
+    if conteos['vigentes']:
+        return 'RESERVADO'
+    return 'LIBRE'
+
+
+def _escribir_estado(espacio_id, nuevo, excluir):
+    """
+    Escribe ``nuevo`` con un único UPDATE condicional: si el espacio ya tiene
+    ese estado (o uno de ``excluir``) no se toca la fila.
+    """
+    cambiados = EspacioParqueadero.objects.filter(pk=espacio_id).exclude(
+        estado__in=[nuevo, *excluir]
+    ).update(estado=nuevo)
+    if cambiados:
+        transaction.on_commit(lambda: estado_espacio_cambiado.send(
+            sender=EspacioParqueadero, espacio_id=espacio_id, estado=nuevo,
+        ), using=router.db_for_write(EspacioParqueadero))
+    return bool(cambiados)
+
+
+def recalcular_estado_espacio(espacio_id):
+    """
+    Deriva y guarda el estado del espacio. Un espacio BLOQUEADO se respeta:
+    solo se desbloquea a mano desde el admin.
+    Devuelve True si el estado cambió.
+    """
+    return _escribir_estado(espacio_id, estado_derivado(espacio_id), excluir=['BLOQUEADO'])
+
+
+def recalcular_estados(espacio_ids=None):
+    """Recalcula varios espacios (todos si ``espacio_ids`` es None)."""
+    if espacio_ids is None:
+        espacio_ids = EspacioParqueadero.objects.values_list('id', flat=True)
+    return sum(recalcular_estado_espacio(espacio_id) for espacio_id in espacio_ids)
+
+
+def bloquear_espacio(espacio_id):
+    """Marca el espacio como BLOQUEADO (p. ej. por una incidencia de daño)."""
+    return _escribir_estado(espacio_id, 'BLOQUEADO', excluir=[])
+
+
+def espacios_vencidos(parqueadero):
+    """
+    Espacios guardados como RESERVADO que ya no tienen reservas RESERVADA de
+    hoy en adelante ni un vehículo dentro. Una sola consulta (NOT EXISTS
+    sobre el índice (espacio, fecha)).
+    """
+    vigentes = Reserva.objects.filter(espacio=OuterRef('pk'), estado='RESERVADA').filter(
+        Q(fecha__gte=timezone.localdate()) | Q(hora_entrada__isnull=False, hora_salida__isnull=True)
+    )
+    return EspacioParqueadero.objects.filter(parqueadero=parqueadero, estado='RESERVADO').exclude(Exists(vigentes))
+
+
+def recalcular_vencidos():
+    """Recalcula en todas las sedes los espacios de ``espacios_vencidos``."""
+    cambiados = 0
+    for parqueadero in sedes().values():
+        with usar_parqueadero(parqueadero):
+            cambiados += recalcular_estados(list(espacios_vencidos(parqueadero).values_list('id', flat=True)))
+    return cambiados
+
+
+def _recalcular_lote(elementos):
+    # Todos los elementos piden lo mismo: una pasada por las sedes
+    recalcular_vencidos()
+    return []
+
+
+cola_estados = ColaTrabajos(
+    'estados',
+    _recalcular_lote,
+    periodo=getattr(settings, 'ESTADOS_INTERVALO_RECALCULO', 600),
+    elemento_periodico='vencidos',
+)
+
+
+class CambioDeDiaMiddleware:
+    """
+    En la primera petición de cada día (por proceso) encola
+    ``recalcular_vencidos``; con eso arranca también el repaso periódico.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.dia = None
+
+    def __call__(self, request):
+        hoy = timezone.localdate()
+        if hoy != self.dia:
+            self.dia = hoy
+            cola_estados.encolar('vencidos')
+        return self.get_response(request)
@@ -0,0 +1,57 @@
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import Signal, receiver
+
+# Se emite (después del commit) cada vez que cambia EspacioParqueadero.estado.
+# Argumentos: espacio_id, estado.
+estado_espacio_cambiado = Signal()
+
+# Campos de Reserva que influyen en el estado del espacio
+CAMPOS_ESTADO = {'espacio', 'estado', 'fecha', 'hora_entrada', 'hora_salida'}
+
+
+@receiver(post_init, sender='core.Reserva')
+def recordar_espacio_original(sender, instance, **kwargs):
+    # Permite liberar el espacio anterior si la reserva se mueve de espacio
+    instance._espacio_id_original = instance.espacio_id
+
+
+@receiver(post_save, sender='core.Reserva')
+def reserva_guardada(sender, instance, created, update_fields, **kwargs):
+    from .servicios import recalcular_estado_espacio
+
+    if update_fields is not None and not CAMPOS_ESTADO.intersection(update_fields):
+        return
+    recalcular_estado_espacio(instance.espacio_id)
+    anterior = getattr(instance, '_espacio_id_original', None)
+    if anterior and anterior != instance.espacio_id:
+        recalcular_estado_espacio(anterior)
+    instance._espacio_id_original = instance.espacio_id
+
+
+@receiver(post_init, sender='core.Vehiculo')
+def recordar_placa_original(sender, instance, **kwargs):
+    instance._placa_original = instance.placa
+
+
+@receiver([post_save, post_delete], sender='core.Vehiculo')
+def vehiculo_modificado(sender, instance, **kwargs):
+    from .placas import cache_placas, normalizar_placa
+
+    cache_placas.invalidar(normalizar_placa(instance.placa), vehiculo_id=instance.id)
+    if instance._placa_original != instance.placa:
+        cache_placas.invalidar(normalizar_placa(instance._placa_original))
+    instance._placa_original = instance.placa
+
+
+@receiver(post_delete, sender='core.Reserva')
+def reserva_eliminada(sender, instance, **kwargs):
+    from .servicios import recalcular_estado_espacio
+
+    recalcular_estado_espacio(instance.espacio_id)
+
+
+@receiver([post_save, post_delete], sender='core.Parqueadero')
+def parqueadero_modificado(sender, **kwargs):
+    from .parqueaderos import invalidar_sedes
+
+    invalidar_sedes()
@@ -0,0 +1,136 @@
+"""
+Cola de trabajos en segundo plano (hilo dentro del proceso).
+
+Agrupa los elementos encolados en lotes y reintenta con espera exponencial
+los que fallan. Es "best effort": si el proceso muere se pierde lo que estaba
+en memoria, por eso cada consumidor guarda en la base de datos qué quedó
+pendiente y tiene un comando para reprocesarlo.
+
+Con ``TAREAS_EN_SEGUNDO_PLANO = False`` los lotes se procesan en el mismo
+hilo que encola (útil en pruebas y comandos).
+
+Cada elemento recuerda la sede actual (``core.parqueaderos``) del momento en
+que se encoló y se procesa con esa misma sede activa.
+
+Con ``periodo`` la cola encola además ``elemento_periodico`` cada ``periodo``
+segundos (sin sede y sin reintentos en memoria), desde que arranca su hilo.
+Sirve para barrer lo que quedó pendiente en la base de datos aunque no
+llegue trabajo nuevo.
+"""
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from .metricas import registro
+from .parqueaderos import parqueadero_actual, usar_parqueadero
+
+logger = logging.getLogger(__name__)
+
+
+class ColaTrabajos:
+    """
+    ``procesar_lote(elementos)`` recibe una lista de elementos y devuelve los
+    que fallaron (o lanza una excepción si falló todo el lote).
+    """
+
+    def __init__(self, nombre, procesar_lote, tamano_lote=20, espera_lote=0.5,
+                 reintentos=3, retraso_base=1.0, periodo=None, elemento_periodico=None):
+        self.nombre = nombre
+        self.procesar_lote = procesar_lote
+        self.tamano_lote = tamano_lote
+        self.espera_lote = espera_lote
+        self.reintentos = reintentos
+        self.retraso_base = retraso_base
+        self.periodo = periodo
+        self.elemento_periodico = elemento_periodico
+        self._cola = queue.Queue()
+        self._hilo = None
+        self._lock = threading.Lock()
+
+    def encolar(self, elemento):
+        self._poner(elemento, 0, parqueadero_actual())
+
+    def encolar_al_confirmar(self, elemento):
+        """Encola cuando la transacción actual se confirme (el trabajador verá la fila)."""
+        parqueadero = parqueadero_actual()
+        transaction.on_commit(lambda: self._poner(elemento, 0, parqueadero))
+
+    def _poner(self, elemento, intento, parqueadero):
+        if not getattr(settings, 'TAREAS_EN_SEGUNDO_PLANO', True):
+            self._ejecutar([(elemento, intento, parqueadero)], sincrono=True)
+            return
+        self._arrancar()
+        self._cola.put((elemento, intento, parqueadero))
+        registro.fijar('miparqueo_queue_depth', self._cola.qsize(), ayuda='Elementos pendientes por cola.',
+                       cola=self.nombre)
+
+    def _arrancar(self):
+        with self._lock:
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(target=self._bucle, name=f'cola-{self.nombre}', daemon=True)
+                self._hilo.start()
+                if self.periodo:
+                    self._programar_periodico()
+
+    def _programar_periodico(self):
+        temporizador = threading.Timer(self.periodo, self._tic_periodico)
+        temporizador.daemon = True
+        temporizador.start()
+
+    def _tic_periodico(self):
+        # Intento = reintentos: si falla no se reintenta, ya lo hará el próximo tic
+        self._cola.put((self.elemento_periodico, self.reintentos, None))
+        self._programar_periodico()
+
+    def _bucle(self):
+        while True:
+            lote = [self._cola.get()]
+            limite = time.monotonic() + self.espera_lote
+            while len(lote) < self.tamano_lote:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    lote.append(self._cola.get(timeout=restante))
+                except queue.Empty:
+                    break
+            close_old_connections()
+            try:
+                self._ejecutar(lote)
+            finally:
+                close_old_connections()
+
+    def _ejecutar(self, lote, sincrono=False):
+        por_sede = {}
+        for elemento, intento, parqueadero in lote:
+            por_sede.setdefault(parqueadero, []).append((elemento, intento))
+        for parqueadero, grupo in por_sede.items():
+            with usar_parqueadero(parqueadero):
+                self._ejecutar_grupo(grupo, parqueadero, sincrono)
+
+    def _ejecutar_grupo(self, lote, parqueadero, sincrono):
+        elementos = [elemento for elemento, _ in lote]
+        intentos = {elemento: intento for elemento, intento in lote}
+        try:
+            fallidos = self.procesar_lote(elementos) or []
+        except Exception:
+            logger.exception('Error procesando lote de la cola %s', self.nombre)
+            fallidos = elementos
+        registro.incrementar('miparqueo_queue_processed_total', len(elementos) - len(fallidos),
+                             ayuda='Elementos procesados con éxito por cola.', cola=self.nombre)
+
+        for elemento in fallidos:
+            intento = intentos[elemento] + 1
+            if intento > self.reintentos or sincrono:
+                logger.error('Cola %s: se descarta %r tras %d intentos', self.nombre, elemento, intento)
+                registro.incrementar('miparqueo_queue_failed_total', ayuda='Elementos descartados por cola.',
+                                     cola=self.nombre)
+                continue
+            retraso = self.retraso_base * 2 ** (intento - 1)
+            temporizador = threading.Timer(retraso, self._poner, args=(elemento, intento, parqueadero))
+            temporizador.daemon = True
+            temporizador.start()
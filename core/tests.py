@@ -1,3 +1,421 @@
-from django.test import TestCase
+import datetime
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import textwrap
+import unittest
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.core import mail
+from django.core.exceptions import ValidationError
+from django.core.mail.backends.locmem import EmailBackend as BackendMemoria
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from .asignacion import IndiceIntervalos, elegir_espacio
+from .correo import enviar_pendientes
+from .forms import tipo_con_vehiculo
+from .models import CorreoSaliente, EspacioParqueadero, Parqueadero, Reserva
+from .parqueaderos import invalidar_sedes, parqueaderos_permitidos
+from .placas import VehiculoRegistrado
+
+
+class EstadoEspacioTests(TestCase):
+    """El estado del espacio se deriva de sus reservas (core.servicios)."""
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('cliente')
+        self.espacio = EspacioParqueadero.objects.create(numero=1, tipo='CARRO')
+        self.hoy = timezone.localdate()
+
+    def reservar(self, hora, fecha=None, **campos):
+        return Reserva.objects.create(
+            usuario=self.usuario, espacio=self.espacio, fecha=fecha or self.hoy,
+            hora_inicio=datetime.time(hora, 0), hora_fin=datetime.time(hora, 59),
+            tipo_vehiculo='CARRO', placa=f'ABC{hora:03d}', **campos,
+        )
+
+    def estado(self):
+        self.espacio.refresh_from_db()
+        return self.espacio.estado
+
+    def test_cancelar_una_de_dos_reservas_no_libera_el_espacio(self):
+        primera, segunda = self.reservar(10), self.reservar(14)
+        self.assertEqual(self.estado(), 'RESERVADO')
+
+        primera.estado = 'CANCELADA'
+        primera.save(update_fields=['estado', 'actualizado_en'])
+        self.assertEqual(self.estado(), 'RESERVADO')
+
+        segunda.estado = 'CANCELADA'
+        segunda.save(update_fields=['estado', 'actualizado_en'])
+        self.assertEqual(self.estado(), 'LIBRE')
+
+    def test_entrada_y_salida(self):
+        reserva, siguiente = self.reservar(10), self.reservar(14)
+
+        reserva.hora_entrada = datetime.time(10, 5)
+        reserva.save(update_fields=['hora_entrada', 'actualizado_en'])
+        self.assertEqual(self.estado(), 'OCUPADO')
+
+        reserva.hora_salida = datetime.time(10, 50)
+        reserva.estado = 'COMPLETADA'
+        reserva.save(update_fields=['hora_salida', 'estado', 'actualizado_en'])
+        self.assertEqual(self.estado(), 'RESERVADO')
+
+        siguiente.hora_entrada = datetime.time(14, 0)
+        siguiente.save(update_fields=['hora_entrada', 'actualizado_en'])
+        siguiente.hora_salida = datetime.time(14, 30)
+        siguiente.estado = 'COMPLETADA'
+        siguiente.save(update_fields=['hora_salida', 'estado', 'actualizado_en'])
+        self.assertEqual(self.estado(), 'LIBRE')
+
+    def test_vehiculo_que_entro_ayer_sigue_ocupando_el_espacio(self):
+        ayer = self.hoy - datetime.timedelta(days=1)
+        self.reservar(22, fecha=ayer, hora_entrada=datetime.time(22, 10))
+        self.assertEqual(self.estado(), 'OCUPADO')
+
+    def test_reserva_de_ayer_sin_entrada_libera_el_espacio_al_cambiar_el_dia(self):
+        reserva = self.reservar(10)
+        self.assertEqual(self.estado(), 'RESERVADO')
+        # Simula el paso del día: la fila cambia sin pasar por save()
+        Reserva.objects.filter(pk=reserva.pk).update(fecha=self.hoy - datetime.timedelta(days=1))
+        self.assertEqual(self.estado(), 'RESERVADO')
+
+        with self.settings(TAREAS_EN_SEGUNDO_PLANO=False):
+            self.client.get('/')  # primera petición del día
+        self.assertEqual(self.estado(), 'LIBRE')
+
+
+class AsignacionTests(SimpleTestCase):
+    """Motor de asignación (core.asignacion) sobre un índice armado a mano."""
+
+    def indice(self, espacios, ocupados=()):
+        indice = IndiceIntervalos(espacios)
+        for espacio_id, inicio, fin in ocupados:
+            indice.agregar(espacio_id, inicio, fin)
+        return indice
+
+    def test_hueco(self):
+        indice = self.indice([(1, 1, 'CARRO')], [(1, 60, 120), (1, 300, 360)])
+        self.assertEqual(indice.hueco(1, 0, 60), (0, 60))
+        self.assertEqual(indice.hueco(1, 120, 180), (120, 300))  # pegada a la anterior
+        self.assertEqual(indice.hueco(1, 400, 500), (360, 24 * 60))
+        self.assertIsNone(indice.hueco(1, 100, 130))
+        self.assertIsNone(indice.hueco(1, 250, 310))
+
+    def test_best_fit_elige_el_hueco_mas_ajustado(self):
+        # Espacio 1 libre todo el día; espacio 2 con un hueco de 120 a 240
+        indice = self.indice([(1, 1, 'CARRO'), (2, 2, 'CARRO')], [(2, 0, 120), (2, 240, 24 * 60)])
+        self.assertEqual(elegir_espacio(indice, 'CARRO', 150, 210), 2)
+        self.assertEqual(elegir_espacio(indice, 'CARRO', 150, 210, estrategia='first_fit'), 1)
+        self.assertEqual(elegir_espacio(indice, 'CARRO', 300, 360), 1)
+
+    def test_compatibilidad_de_tipos(self):
+        espacios = [(1, 1, 'CARRO'), (2, 2, 'DISCAPACIDAD'), (3, 3, 'MOTO')]
+        indice = self.indice(espacios)
+        self.assertEqual(elegir_espacio(indice, 'DISCAPACIDAD', 60, 120), 2)
+        self.assertEqual(elegir_espacio(indice, 'MOTO', 60, 120), 3)
+        self.assertEqual(elegir_espacio(indice, 'CARRO', 60, 120), 1)
+
+        # Sin espacios DISCAPACIDAD libres se recurre a CARRO; CARRO y MOTO no se cruzan
+        indice = self.indice(espacios, [(1, 60, 120), (2, 60, 120), (3, 60, 120)])
+        self.assertIsNone(elegir_espacio(indice, 'CARRO', 60, 120))
+        indice = self.indice(espacios, [(2, 60, 120), (3, 60, 120)])
+        self.assertEqual(elegir_espacio(indice, 'DISCAPACIDAD', 60, 120), 1)
+        self.assertIsNone(elegir_espacio(indice, 'MOTO', 60, 120))
+
+    def test_tipo_de_un_vehiculo_registrado(self):
+        carro = VehiculoRegistrado(1, 1, 'CARRO', 'ABC123')
+        moto = VehiculoRegistrado(2, 1, 'MOTO', 'XYZ12A')
+        self.assertEqual(tipo_con_vehiculo('', moto), 'MOTO')
+        self.assertEqual(tipo_con_vehiculo('DISCAPACIDAD', carro), 'DISCAPACIDAD')
+        for tipo in ('DISCAPACIDAD', 'CARRO'):
+            with self.assertRaises(ValidationError):
+                tipo_con_vehiculo(tipo, moto)
+        with self.assertRaises(ValidationError):
+            tipo_con_vehiculo('MOTO', carro)
+
+
+class ParqueaderosPermitidosTests(TestCase):
+    def setUp(self):
+        self.principal = Parqueadero.principal()
+        self.norte = Parqueadero.objects.create(nombre='Norte', codigo='norte')
+        invalidar_sedes()
+        self.addCleanup(invalidar_sedes)
+
+    def test_vigilante_sin_sedes_solo_usa_la_principal(self):
+        vigilante = User.objects.create_user('vigilante')
+        vigilante.groups.add(Group.objects.get_or_create(name='VIGILANTE')[0])
+        self.assertEqual(parqueaderos_permitidos(vigilante), [self.principal])
+
+        self.norte.vigilantes.add(vigilante)
+        self.assertEqual(parqueaderos_permitidos(vigilante), [self.norte])
+
+    def test_cliente_usa_todas(self):
+        cliente = User.objects.create_user('cliente')
+        self.assertEqual(parqueaderos_permitidos(cliente), [self.principal, self.norte])
+
+
+class BackendRechazaDestinatario(BackendMemoria):
+    """Falla solo los mensajes para rechazado@example.com."""
+
+    def send_messages(self, messages):
+        if any('rechazado@example.com' in mensaje.to for mensaje in messages):
+            raise OSError('550 buzón inexistente')
+        return super().send_messages(messages)
+
+
+class BackendSinConexion(BackendMemoria):
+    def open(self):
+        raise OSError('535 credenciales inválidas')
+
+
+@override_settings(
+    EMAIL_BACKEND='core.correo.BackendCola',
+    CORREO_BACKEND_ENVIO='core.tests.BackendRechazaDestinatario',
+    CORREO_MAX_INTENTOS=3,
+    CORREO_RETRASO_BASE=60,
+    TAREAS_EN_SEGUNDO_PLANO=False,
+)
+class BandejaSalidaTests(TestCase):
+    """Bandeja de salida (core.correo) con el backend en memoria de Django."""
+
+    def encolar(self, destinatario):
+        mail.send_mail('Asunto', 'Cuerpo', 'parqueo@example.com', [destinatario])
+        return CorreoSaliente.objects.latest('id')
+
+    def vencer_esperas(self):
+        CorreoSaliente.objects.update(proximo_intento=timezone.now())
+
+    def test_encolar_no_envia_y_el_envio_usa_el_backend_real(self):
+        correo = self.encolar('cliente@example.com')
+        self.assertEqual(correo.estado, 'PENDIENTE')
+        self.assertEqual(len(mail.outbox), 0)
+
+        self.assertEqual(enviar_pendientes(), (1, []))
+        correo.refresh_from_db()
+        self.assertEqual((correo.estado, correo.intentos), ('ENVIADO', 1))
+        self.assertEqual(mail.outbox[0].to, ['cliente@example.com'])
+
+    def test_fallo_de_un_mensaje_reintenta_con_espera_y_termina_fallido(self):
+        bueno, malo = self.encolar('cliente@example.com'), self.encolar('rechazado@example.com')
+        antes = timezone.now()
+        self.assertEqual(enviar_pendientes(), (2, [malo.id]))
+        bueno.refresh_from_db()
+        malo.refresh_from_db()
+        self.assertEqual(bueno.estado, 'ENVIADO')
+        self.assertEqual((malo.estado, malo.intentos), ('PENDIENTE', 1))
+        self.assertIn('550', malo.ultimo_error)
+        self.assertGreaterEqual(malo.proximo_intento, antes + datetime.timedelta(seconds=60))
+
+        # Antes de vencer la espera no se reintenta
+        self.assertEqual(enviar_pendientes(), (0, []))
+        self.vencer_esperas()
+        enviar_pendientes()
+        malo.refresh_from_db()
+        self.assertEqual((malo.intentos, malo.estado), (2, 'PENDIENTE'))
+        self.vencer_esperas()
+        with self.assertLogs('core.correo', 'ERROR'):
+            enviar_pendientes()
+        malo.refresh_from_db()
+        self.assertEqual((malo.intentos, malo.estado), (3, 'FALLIDO'))
+        self.vencer_esperas()
+        self.assertEqual(enviar_pendientes(), (0, []))
+
+    @override_settings(CORREO_BACKEND_ENVIO='core.tests.BackendSinConexion')
+    def test_fallo_de_conexion_cuenta_como_intento(self):
+        correos = [self.encolar('cliente@example.com'), self.encolar('otro@example.com')]
+        esperas = []
+        for intentos, estado in [(1, 'PENDIENTE'), (2, 'PENDIENTE'), (3, 'FALLIDO')]:
+            antes = timezone.now()
+            with self.assertLogs('core.correo', 'ERROR'):
+                enviar_pendientes()
+            for correo in correos:
+                correo.refresh_from_db()
+                self.assertEqual((correo.intentos, correo.estado), (intentos, estado))
+                self.assertIn('535', correo.ultimo_error)
+            esperas.append(correos[0].proximo_intento - antes)
+            self.vencer_esperas()
+        # Espera exponencial: 60 s y luego 120 s
+        self.assertGreaterEqual(esperas[0], datetime.timedelta(seconds=60))
+        self.assertGreaterEqual(esperas[1], datetime.timedelta(seconds=120))
+        self.assertEqual(len(mail.outbox), 0)
+
+
+# Se ejecuta en un proceso aparte con su propia base SQLite y su propio
+# diario, para poder matarlo con SIGKILL a mitad de la sincronización.
+PROGRAMA_PORTERIA = textwrap.dedent('''
+    import json, os, signal, sys
+    import django
+    django.setup()
+    from django.core.management import call_command
+    from django.contrib.auth.models import Group, User
+    from core import porteria
+    from core.models import EspacioParqueadero, EventoPorteria, Parqueadero, Reserva
+    import datetime
+
+    fase = sys.argv[1]
+
+    def matar_en(funcion, llamada):
+        contador = [0]
+        def envoltura(*args, **kwargs):
+            contador[0] += 1
+            if contador[0] == llamada:
+                os.kill(os.getpid(), signal.SIGKILL)
+            return funcion(*args, **kwargs)
+        return envoltura
+
+    if fase == 'preparar':
+        call_command('migrate', verbosity=0)
+        usuario = User.objects.create_user('cliente')
+        espacios = [EspacioParqueadero.objects.create(numero=i, tipo='CARRO') for i in range(1, 6)]
+        hoy = datetime.date.today()
+        porteria.cola_porteria.encolar = lambda elemento: None  # solo escribir el diario
+        reservas = [
+            Reserva.objects.create(
+                usuario=usuario, espacio=espacios[i % 5], fecha=hoy, hora_inicio=datetime.time(i // 5, 0),
+                hora_fin=datetime.time(i // 5, 59), tipo_vehiculo='CARRO', placa=f'ABC{i:03d}',
+            )
+            for i in range(int(sys.argv[2]))
+        ]
+        for tipo in ('ENTRADA', 'SALIDA'):
+            for reserva in reservas:
+                porteria.registrar_evento(tipo, reserva)
+
+    elif fase == 'matar_tras_commit':
+        # Muere con el tercer lote ya confirmado pero antes de guardar la posición
+        porteria.guardar_posicion = matar_en(porteria.guardar_posicion, 3)
+        porteria.sincronizar()
+
+    elif fase == 'matar_en_transaccion':
+        # Muere a mitad de un lote, con la transacción abierta
+        porteria._aplicar = matar_en(porteria._aplicar, 15)
+        porteria.sincronizar()
+
+    elif fase == 'sede_desconocida':
+        # Las reservas del tercer lote pasan a una sede que este proceso aún no conoce
+        ruta = porteria.ruta_diario()
+        with open(ruta) as archivo:
+            eventos = [json.loads(linea) for linea in archivo]
+        movidas = {evento['reserva_id'] for evento in eventos[20:30]}
+        for evento in eventos:
+            if evento['reserva_id'] in movidas:
+                evento['parqueadero_id'] = 999
+        with open(ruta, 'w') as archivo:
+            archivo.writelines(json.dumps(evento) + '\\n' for evento in eventos)
+        porteria.sincronizar()
+        print(json.dumps({'aplicados': EventoPorteria.objects.count(), 'pendientes': len(porteria.pendientes())}))
+
+        # Otro proceso crea la sede (sin las señales de este, que sigue con la caché vieja)
+        porteria.sedes()
+        Parqueadero.objects.bulk_create([Parqueadero(id=999, nombre='Norte', codigo='norte')])
+        Reserva.objects.filter(id__in=movidas).update(parqueadero_id=999)
+        porteria.sincronizar()
+
+    elif fase == 'estado':
+        print(json.dumps({'aplicados': EventoPorteria.objects.count(), 'pendientes': len(porteria.pendientes())}))
+
+    elif fase == 'sincronizar':
+        call_command('reproducir_porteria', verbosity=0)
+        print(json.dumps({
+            'uuids': [str(valor) for valor in EventoPorteria.objects.values_list('uuid', flat=True)],
+            'resultados': sorted(EventoPorteria.objects.values_list('resultado', flat=True).distinct()),
+            'completadas': Reserva.objects.filter(
+                estado='COMPLETADA', hora_entrada__isnull=False, hora_salida__isnull=False,
+            ).count(),
+            'espacios': sorted(set(EspacioParqueadero.objects.values_list('estado', flat=True))),
+            'pendientes': len(porteria.pendientes()),
+        }))
+''')
+
+
+@unittest.skipUnless(hasattr(signal, 'SIGKILL'), 'Requiere SIGKILL (POSIX)')
+class DiarioPorteriaTests(SimpleTestCase):
+    RESERVAS = 30
+    TAMANO_LOTE = 10
+
+    def setUp(self):
+        self.directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directorio.cleanup)
+        base = self.directorio.name
+        with open(os.path.join(base, 'ajustes_diario.py'), 'w') as archivo:
+            archivo.write(textwrap.dedent(f'''
+                from MiParqueo.settings import *
+                DATABASES = {{'default': {{'ENGINE': 'django.db.backends.sqlite3', 'NAME': {os.path.join(base, 'db.sqlite3')!r}}}}}
+                PORTERIA_MODO_DIARIO = True
+                PORTERIA_DIARIO_DIR = {os.path.join(base, 'diario')!r}
+                PORTERIA_TAMANO_LOTE = {self.TAMANO_LOTE}
+                TAREAS_EN_SEGUNDO_PLANO = False
+                EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+                LOGGING = {{'version': 1}}
+            '''))
+        self.entorno = dict(
+            os.environ,
+            PYTHONPATH=os.pathsep.join([base, str(settings.BASE_DIR)]),
+            DJANGO_SETTINGS_MODULE='ajustes_diario',
+        )
+
+    def ejecutar(self, *argumentos):
+        return subprocess.run(
+            [sys.executable, '-c', PROGRAMA_PORTERIA, *argumentos],
+            cwd=settings.BASE_DIR, env=self.entorno, capture_output=True, text=True, timeout=120,
+        )
+
+    def uuids_del_diario(self):
+        with open(os.path.join(self.directorio.name, 'diario', 'eventos.jsonl')) as archivo:
+            return [json.loads(linea)['uuid'] for linea in archivo if linea.strip()]
+
+    def test_proceso_muerto_a_mitad_de_sincronizar(self):
+        preparado = self.ejecutar('preparar', str(self.RESERVAS))
+        self.assertEqual(preparado.returncode, 0, preparado.stderr)
+        escritos = self.uuids_del_diario()
+        self.assertEqual(len(escritos), 2 * self.RESERVAS)
+
+        # (fase, eventos en la base, eventos pendientes según la posición guardada)
+        esperado = [
+            # 3 lotes confirmados, posición guardada tras el segundo
+            ('matar_tras_commit', 30, 40),
+            # el tercer lote se salta por uuid, el cuarto se confirma y el quinto se revierte
+            ('matar_en_transaccion', 40, 20),
+        ]
+        for fase, aplicados, pendientes in esperado:
+            muerto = self.ejecutar(fase)
+            self.assertEqual(muerto.returncode, -signal.SIGKILL, f'{fase}: {muerto.stderr}')
+            estado = self.ejecutar('estado')
+            self.assertEqual(json.loads(estado.stdout.strip().splitlines()[-1]),
+                             {'aplicados': aplicados, 'pendientes': pendientes}, fase)
+
+        final = self.ejecutar('sincronizar')
+        self.assertEqual(final.returncode, 0, final.stderr)
+        self.comprobar_todo_aplicado(final, escritos)
+
+    def test_sede_desconocida_deja_los_eventos_pendientes(self):
+        preparado = self.ejecutar('preparar', str(self.RESERVAS))
+        self.assertEqual(preparado.returncode, 0, preparado.stderr)
+        escritos = self.uuids_del_diario()
+
+        pasada = self.ejecutar('sede_desconocida')
+        self.assertEqual(pasada.returncode, 0, pasada.stderr)
+        self.assertIn('sede 999 desconocida', pasada.stderr)
+        # Se detiene antes del tercer lote y no compacta el diario
+        self.assertEqual(json.loads(pasada.stdout.strip().splitlines()[0]), {'aplicados': 20, 'pendientes': 40})
+
+        # La segunda pasada relee las sedes y aplica los eventos que quedaron
+        final = self.ejecutar('sincronizar')
+        self.assertEqual(final.returncode, 0, final.stderr)
+        self.comprobar_todo_aplicado(final, escritos)
+
+    def comprobar_todo_aplicado(self, final, escritos):
+        estado = json.loads(final.stdout.strip().splitlines()[-1])
+
+        # Cada evento del diario quedó aplicado exactamente una vez
+        self.assertCountEqual(estado['uuids'], escritos)
+        self.assertEqual(estado['resultados'], ['APLICADO'])
+        self.assertEqual(estado['completadas'], self.RESERVAS)
+        self.assertEqual(estado['espacios'], ['LIBRE'])
+        self.assertEqual(estado['pendientes'], 0)
@@ -10,6 +10,7 @@ urlpatterns = [
     path('login/', auth_views.LoginView.as_view(template_name="login.html"), name='login'),
     path('logout/', auth_views.LogoutView.as_view(next_page='core:login'), name='logout'),
     path('registro/', views.registro, name='registro'),
+    path('parqueadero/', views.seleccionar_parqueadero, name='seleccionar_parqueadero'),
 
     # Password Reset
     path('password_reset/', auth_views.PasswordResetView.as_view(template_name='password_reset_form.html', email_template_name='password_reset_email.html', success_url='/password_reset/done/'), name='password_reset'),
@@ -21,6 +22,7 @@ urlpatterns = [
     # Cliente
     path('cliente/disponibilidad/', views.disponibilidad, name='disponibilidad'),
     path('cliente/reservar/', views.crear_reserva, name='crear_reserva'),
+    path('cliente/reservar/espacios/', views.espacios_libres, name='espacios_libres'),
     path('cliente/reservas/', views.reservas_activas, name='reservas_activas'),
     path('cliente/historial/', views.historial_reservas, name='historial'),
     path('cliente/cancelar/<int:reserva_id>/', views.cancelar_reserva, name='cancelar_reserva'),
@@ -36,4 +38,8 @@ urlpatterns = [
     path('vigilante/salida/', views.listado_salidas, name='listado_salidas'),
     path('vigilante/salida/<int:reserva_id>/', views.registrar_salida, name='registrar_salida'),
     path('vigilante/ocupacion/', views.ocupacion_actual, name='ocupacion_actual'),
+    path('vigilante/incidencia/', views.reportar_incidencia, name='reportar_incidencia'),
+
+    # Instrumentación
+    path('metricas/', views.metricas, name='metricas'),
 ]
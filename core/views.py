@@ -1,12 +1,24 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.utils.http import url_has_allowed_host_and_scheme
+from django.views.decorators.http import require_POST
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth import login
 from django.contrib import messages
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse
+from django.conf import settings
 from django.utils import timezone
 from django.db.models import Q
 from .models import EspacioParqueadero, Reserva, Vehiculo
-from .forms import ReservaForm, RegistroForm, VehiculoForm
+from .forms import ReservaForm, RegistroForm, VehiculoForm, IncidenciaForm, FiltroEspaciosForm
+from .incidencias import cola_incidencias
+from .correo import enviar_confirmacion_reserva
+from .metricas import registro as registro_metricas
+from .parqueaderos import parqueaderos_permitidos
+from .placas import buscar_vehiculo, normalizar_placa
+from .porteria import (en_curso_con_pendientes, modo_diario, pendientes_de, registrar_evento,
+                       superponer_pendientes)
 import datetime
+import hmac
 
 # --- Funciones de ayuda para roles ---
 def is_vigilante(user):
@@ -45,25 +57,45 @@ def registro(request):
         form = RegistroForm()
     return render(request, 'registro.html', {'form': form})
 
+@login_required
+@require_POST
+def seleccionar_parqueadero(request):
+    """
+    Cambia la sede actual de la sesión. Un vigilante solo puede elegir
+    las sedes que tiene asignadas.
+    """
+    elegida = request.POST.get('parqueadero', '')
+    permitidas = {parqueadero.id: parqueadero for parqueadero in parqueaderos_permitidos(request.user)}
+    if elegida.isdigit() and int(elegida) in permitidas:
+        request.session['parqueadero_id'] = int(elegida)
+        messages.success(request, f'Sede: {permitidas[int(elegida)].nombre}.')
+    else:
+        messages.error(request, 'Sede no disponible.')
+
+    destino = request.POST.get('next')
+    if not url_has_allowed_host_and_scheme(destino, allowed_hosts={request.get_host()}):
+        destino = 'core:home'
+    return redirect(destino)
+
 # --- Vistas Cliente ---
 
 @login_required
 def disponibilidad(request):
     """
-    Muestra todos los espacios y su estado actual.
+    Muestra los espacios de la sede actual y su estado.
     Permite reservar si está LIBRE.
     """
-    espacios = EspacioParqueadero.objects.all().order_by('numero')
+    espacios = EspacioParqueadero.objects.filter(parqueadero=request.parqueadero).order_by('numero')
     return render(request, 'cliente/disponibilidad.html', {'espacios': espacios})
 
 @login_required
 def crear_reserva(request):
     """
     Formulario para crear una reserva.
-    Valida solapamientos y actualiza estado del espacio.
+    Valida solapamientos; el estado del espacio se deriva de sus reservas.
     """
     if request.method == 'POST':
-        form = ReservaForm(request.POST)
+        form = ReservaForm(request.POST, user=request.user, parqueadero=request.parqueadero)
         if form.is_valid():
             reserva = form.save(commit=False)
             reserva.usuario = request.user
@@ -72,12 +104,10 @@ def crear_reserva(request):
             # Validación extra de solapamiento (ya hecha en form, pero doble check por seguridad)
             # ... (la validación del form.clean() ya se ejecutó)
             
+            # El espacio pasa a RESERVADO vía core.signals -> core.servicios
             reserva.save()
-            
-            # Actualizar estado del espacio a RESERVADO
-            espacio = reserva.espacio
-            espacio.estado = 'RESERVADO'
-            espacio.save()
+            # Solo se encola; el envío ocurre fuera de la petición
+            enviar_confirmacion_reserva(reserva)
             
             messages.success(request, 'Reserva creada exitosamente.')
             return redirect('core:reservas_activas')
@@ -89,10 +119,26 @@ def crear_reserva(request):
         espacio_id = request.GET.get('espacio_id')
         if espacio_id:
             initial_data['espacio'] = espacio_id
-        form = ReservaForm(initial=initial_data)
+        form = ReservaForm(initial=initial_data, user=request.user, parqueadero=request.parqueadero)
 
     return render(request, 'cliente/crear_reserva.html', {'form': form})
 
+@login_required
+def espacios_libres(request):
+    """
+    JSON con los espacios compatibles y libres para fecha, horario y tipo de
+    vehículo (o vehículo registrado). Lo consulta el formulario de reserva
+    cada vez que cambian esos datos.
+    """
+    filtro = FiltroEspaciosForm(request.GET, user=request.user, parqueadero=request.parqueadero)
+    if not filtro.is_valid():
+        return JsonResponse({'espacios': [], 'errores': filtro.errors}, status=400)
+    espacios = [
+        {'id': espacio_id, 'numero': numero, 'tipo': tipo}
+        for espacio_id, numero, tipo in filtro.espacios().values_list('id', 'numero', 'tipo')
+    ]
+    return JsonResponse({'espacios': espacios})
+
 @login_required
 def reservas_activas(request):
     """
@@ -128,14 +174,8 @@ def cancelar_reserva(request, reserva_id):
 
     if ahora < inicio_reserva:
         reserva.estado = 'CANCELADA'
-        reserva.save()
-        
-        # Liberar espacio si no hay otras reservas inmediatas (simplificado: liberar siempre)
-        # En un sistema real, verificaríamos si hay otra reserva solapada ahora mismo.
-        # Asumimos que al cancelar se libera.
-        espacio = reserva.espacio
-        espacio.estado = 'LIBRE'
-        espacio.save()
+        # El espacio solo queda LIBRE si no tiene otras reservas vigentes
+        reserva.save(update_fields=['estado', 'actualizado_en'])
         
         messages.success(request, 'Reserva cancelada.')
     else:
@@ -188,6 +228,7 @@ def validar_placa(request):
     """
     reserva_encontrada = None
     mensaje = None
+    placa = ''
     
     if request.method == 'POST':
         placa = request.POST.get('placa')
@@ -198,23 +239,35 @@ def validar_placa(request):
         # Buscar reserva RESERVADA para hoy, esa placa, y que la hora actual esté en rango (o cerca)
         # Margen de tolerancia: ej. llegar 15 min antes.
         # Aquí buscamos coincidencia exacta de fecha y rango de horas.
+        # Primero la sede: usa el índice (parqueadero, fecha, estado)
         qs = Reserva.objects.filter(
-            placa__iexact=placa,
+            parqueadero=request.parqueadero,
             fecha=fecha_actual,
             estado='RESERVADA',
             hora_inicio__lte=hora_actual,
             hora_fin__gte=hora_actual
-        )
-        
-        if qs.exists():
-            reserva_encontrada = qs.first()
-        else:
+        ).select_related('espacio')
+
+        # Si la placa está registrada se busca por el vehículo (FK indexada),
+        # la caché de placas evita consultar Vehiculo en cada validación.
+        vehiculo = buscar_vehiculo(placa)
+        if vehiculo:
+            reserva_encontrada = qs.filter(vehiculo_id=vehiculo.vehiculo_id).first()
+        if reserva_encontrada is None:
+            reserva_encontrada = qs.filter(placa=normalizar_placa(placa)).first()
+
+        if reserva_encontrada is not None and modo_diario():
+            # Entrada o salida ya anotada en el diario pero aún sin sincronizar
+            superponer_pendientes({reserva_encontrada.id: reserva_encontrada}, pendientes_de(request.parqueadero))
+
+        if reserva_encontrada is None:
             # Intentar buscar si llega un poco antes (opcional, no pedido explícitamente pero útil)
             mensaje = "No existe reserva activa para esta placa en este momento."
 
     return render(request, 'vigilante/validar_placa.html', {
         'reserva': reserva_encontrada,
-        'mensaje': mensaje
+        'mensaje': mensaje,
+        'placa': placa,
     })
 
 @login_required
@@ -223,15 +276,16 @@ def registrar_entrada(request, reserva_id):
     """
     Registra la entrada del vehículo.
     """
-    reserva = get_object_or_404(Reserva, id=reserva_id)
+    reserva = get_object_or_404(Reserva, id=reserva_id, parqueadero=request.parqueadero)
+    if modo_diario():
+        # Se anota en el diario local y se responde; core.porteria lo aplica después
+        registrar_evento('ENTRADA', reserva, vigilante=request.user)
+        messages.success(request, f'Entrada registrada para {reserva.placa}.')
+        return redirect('core:validar_placa')
     reserva.hora_entrada = timezone.now().time()
     # El estado sigue siendo RESERVADA o podríamos cambiarlo a 'EN_CURSO' si existiera.
-    # Lo importante es marcar el espacio como OCUPADO.
-    reserva.save()
-    
-    espacio = reserva.espacio
-    espacio.estado = 'OCUPADO'
-    espacio.save()
+    # Con hora_entrada y sin hora_salida el espacio se deriva como OCUPADO.
+    reserva.save(update_fields=['hora_entrada', 'actualizado_en'])
     
     messages.success(request, f'Entrada registrada para {reserva.placa}.')
     return redirect('core:validar_placa')
@@ -242,37 +296,85 @@ def listado_salidas(request):
     """
     Lista vehículos que han entrado pero no salido.
     (Reserva con hora_entrada NOT NULL y hora_salida NULL)
+    Sin filtrar por fecha: un vehículo que entró ayer sigue dentro.
     """
     reservas_en_curso = Reserva.objects.filter(
+        parqueadero=request.parqueadero,
+        estado='RESERVADA',
         hora_entrada__isnull=False,
         hora_salida__isnull=True,
-        fecha=timezone.now().date() # Solo de hoy
-    )
+    ).select_related('espacio').order_by('fecha', 'hora_entrada')
+    if modo_diario():
+        # Las entradas y salidas del diario aún no están en la base
+        reservas_en_curso = en_curso_con_pendientes(list(reservas_en_curso), request.parqueadero)
     return render(request, 'vigilante/salida.html', {'reservas': reservas_en_curso})
 
 @login_required
 @user_passes_test(is_vigilante)
 def registrar_salida(request, reserva_id):
     """
-    Registra salida y libera espacio.
+    Registra salida; el espacio se libera si no tiene otras reservas vigentes.
     """
-    reserva = get_object_or_404(Reserva, id=reserva_id)
+    reserva = get_object_or_404(Reserva, id=reserva_id, parqueadero=request.parqueadero)
+    if modo_diario():
+        registrar_evento('SALIDA', reserva, vigilante=request.user)
+        messages.success(request, f'Salida registrada para {reserva.placa}.')
+        return redirect('core:listado_salidas')
     reserva.hora_salida = timezone.now().time()
     reserva.estado = 'COMPLETADA'
-    reserva.save()
-    
-    espacio = reserva.espacio
-    espacio.estado = 'LIBRE'
-    espacio.save()
+    reserva.save(update_fields=['hora_salida', 'estado', 'actualizado_en'])
     
     messages.success(request, f'Salida registrada para {reserva.placa}.')
     return redirect('core:listado_salidas')
 
+@login_required
+@user_passes_test(is_vigilante)
+@require_POST
+def reportar_incidencia(request):
+    """
+    Registra una incidencia desde la portería y vuelve de inmediato.
+    El enlace con la reserva, el bloqueo del espacio y el aviso a los
+    administradores se hacen en segundo plano (core.incidencias).
+    """
+    form = IncidenciaForm(request.POST, parqueadero=request.parqueadero)
+    if form.is_valid():
+        incidencia = form.save(commit=False)
+        incidencia.parqueadero = request.parqueadero
+        incidencia.reportado_por = request.user
+        incidencia.save()
+        cola_incidencias.encolar_al_confirmar(incidencia.id)
+        messages.success(request, f'Incidencia {incidencia.get_tipo_display()} registrada.')
+    else:
+        messages.error(request, 'No se pudo registrar la incidencia.')
+
+    destino = request.POST.get('next')
+    if not url_has_allowed_host_and_scheme(destino, allowed_hosts={request.get_host()}):
+        destino = 'core:validar_placa'
+    return redirect(destino)
+
 @login_required
 @user_passes_test(is_vigilante)
 def ocupacion_actual(request):
     """
-    Muestra estado de todos los espacios para el vigilante.
+    Muestra estado de todos los espacios de la sede para el vigilante.
     """
-    espacios = EspacioParqueadero.objects.all().order_by('numero')
+    espacios = EspacioParqueadero.objects.filter(parqueadero=request.parqueadero).order_by('numero')
     return render(request, 'vigilante/ocupacion.html', {'espacios': espacios})
+
+# --- Instrumentación ---
+
+def _token_metricas_valido(request):
+    token = getattr(settings, 'METRICAS_TOKEN', '')
+    cabecera = request.headers.get('Authorization', '')
+    if not token or not cabecera.startswith('Bearer '):
+        return False
+    return hmac.compare_digest(cabecera[len('Bearer '):].encode(), token.encode())
+
+def metricas(request):
+    """
+    Exporta las métricas del proceso en formato de texto de Prometheus.
+    Solo para superusuarios o con el token de METRICAS_TOKEN.
+    """
+    if not (request.user.is_superuser or _token_metricas_valido(request)):
+        return HttpResponseForbidden()
+    return HttpResponse(registro_metricas.prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')